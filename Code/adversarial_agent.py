@@ -1,93 +1,216 @@
 import math
 
-import networkx as nx
-
+import transposition_table as tt
 from multiplayer_agent import MultiplayerAgent
 
 
 class AdversarialAgent(MultiplayerAgent):
-    def __init__(self, depth):
-        super().__init__(depth)
+    def __init__(self, depth, **kwargs):
+        """
+        :param depth: Cutoff depth of the search
+        :param kwargs: Search options of MultiplayerAgent
+        """
+        super().__init__(depth, **kwargs)
         self.heuristic = adversarial_heuristic
 
-    def act(self, state):
-        if state.is_agent_moving(self.aid):
-            return ("noop",)
-        # Creating a search tree, keep this field to keep track of vertex ids
-        self.vertex_id = 0
-        tree = nx.DiGraph()
-        # Add the root to the tree
-        tree.add_node(self.vertex_id, state=state)
-        self.vertex_id += 1
-        # Populate tree
-        self.alphabeta(tree, 0, self.depth, -math.inf, math.inf)
-        # self.print_tree(tree)
-        self.num_call += 1
-        return self.select_best_branch(tree)
+    def search_root(self, state, depth, node=None, first=None):
+        # The root is always expanded (and not looked up in the transposition table) because we pick the action from its
+        # children. Max player picks the first child with the highest value and min player the first with the lowest
+        self.nodes += 1
+        alpha, beta = -math.inf, math.inf
+        best = None
+        best_index = math.inf
+        search = self.alphabeta_in_place if self.search_in_place else self.alphabeta
+        successors = self.expand(state)
+        index = {id(s): i for i, s in enumerate(successors)}
+        for s in self.order_successors(state, successors, first):
+            # A child that comes before the best one in State.expand() wins a tie, so it is searched with a window just
+            # wide enough to get its exact value when it is equal to the best value
+            i = index[id(s)]
+            if self.aid == 0:  # Max player
+                lower = math.nextafter(alpha, -math.inf) if i < best_index else alpha
+                value = search(s, depth - 1, lower, beta, self.record_child(node, state, s))
+                if value > alpha or (value == alpha and i < best_index):
+                    alpha = value
+                    best, best_index = s, i
+            else:  # Min player
+                upper = math.nextafter(beta, math.inf) if i < best_index else beta
+                value = search(s, depth - 1, alpha, upper, self.record_child(node, state, s))
+                if value < beta or (value == beta and i < best_index):
+                    beta = value
+                    best, best_index = s, i
+        self.record_value(node, alpha if self.aid == 0 else beta)
+        return best
+
+    def search_child(self, child, depth, bound):
+        # The window lets a child that equals the bound get its exact value, so ties can be broken by expand() order
+        search = self.alphabeta_in_place if self.search_in_place else self.alphabeta
+        if self.aid == 0:  # Max player
+            return search(child, depth - 1, math.nextafter(bound, -math.inf), math.inf)
+        return search(child, depth - 1, -math.inf, math.nextafter(-bound, math.inf))
+
+    def root_key(self, value):
+        return value if self.aid == 0 else -value
 
-    def alphabeta(self, tree, node, depth, alpha, beta, ):
+    def alphabeta(self, state, depth, alpha, beta, node=None):
         """
-        :param tree: The tree we're constructing
-        :param node: The id (int) of the root of the current subtree
+        :param state: The state at the root of the current subtree
         :param depth: Depth of search tree
         :param alpha: Alpha parameter
         :param beta: Beta parameter
+        :param node: The id (int) of the root of the current subtree in the recorded search tree, None if not recording
         :return: Value of root node
         """
-        # Get the state of the root node
-        state = tree.nodes[node]['state']
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_budget()
         # If we reached the cutoff we call the static heuristic evaluation function.
         # We also call it if we reached a terminal node because we use the same function for eval and true score
         if depth == 0 or state.is_state_terminal():
-            tree.nodes[node]['value'] = self.heuristic(state)
-            return self.heuristic(state)
+            if depth == 0:
+                self.depth_cutoff = True
+            value = self.evaluate(state)
+            self.record_value(node, value)
+            return value
+        # The same position is often reached by different move orders, look it up before expanding it. Even if it was
+        # not searched deep enough to use its value, its best move is likely to be good here too
+        alpha_orig, beta_orig = alpha, beta
+        outer_cutoff = self.depth_cutoff
+        self.depth_cutoff = False
+        first = None
+        table = self.transposition_table
+        if table is not None:
+            entry = table.probe(state.zobrist_hash)
+            if entry is not None:
+                first = entry[4]
+                if entry[1] >= depth:
+                    self.depth_cutoff = entry[1] != tt.COMPLETE
+                    if entry[3] == tt.EXACT:
+                        alpha = beta = entry[2]
+                    elif entry[3] == tt.LOWER:
+                        alpha = max(alpha, entry[2])
+                    else:
+                        beta = min(beta, entry[2])
+                    if alpha >= beta:
+                        self.depth_cutoff = self.depth_cutoff or outer_cutoff
+                        self.record_value(node, entry[2])
+                        return entry[2]
+        best = None
+        ply = self.root_depth - depth
+        successors = self.successors(state, first, ply)
         # Check if max player's turn or min player's turn
         if state.agent_turn == 0:  # Max player
             value = -math.inf  # Value of current node, initially is set to -infinity
-            for s in state.expand():
-                tree.add_node(self.vertex_id, state=s)
-                tree.add_edge(node, self.vertex_id, label=self.get_edge_label(state, s))
-                self.vertex_id += 1
+            for i, s in enumerate(successors):
                 # Value is the maximum between the current value and a successor
-                value = max(value, self.alphabeta(tree, self.vertex_id - 1, depth - 1, alpha, beta))
+                s_value = self.alphabeta(s, depth - 1, alpha, beta, self.record_child(node, state, s))
+                if s_value > value:
+                    value = s_value
+                    best = s
                 alpha = max(value, alpha)
                 if alpha >= beta:
+                    self.report_cutoff(state, s, ply, depth, i)
                     break
-            tree.nodes[node]['value'] = value  # Update value
-            return value
         else:  # Min player, the same, but with minimum
             value = math.inf
-            for s in state.expand():
-                tree.add_node(self.vertex_id, state=s)
-                tree.add_edge(node, self.vertex_id, label=self.get_edge_label(state, s))
-                self.vertex_id += 1
-                value = min(value, self.alphabeta(tree, self.vertex_id - 1, depth - 1, alpha, beta))
+            for i, s in enumerate(successors):
+                s_value = self.alphabeta(s, depth - 1, alpha, beta, self.record_child(node, state, s))
+                if s_value < value:
+                    value = s_value
+                    best = s
                 beta = min(value, beta)
                 if alpha >= beta:
+                    self.report_cutoff(state, s, ply, depth, i)
                     break
-            tree.nodes[node]['value'] = value
-            return value
+        self.record_value(node, value)  # Update value
+        self.store(state, depth if self.depth_cutoff else tt.COMPLETE, value, alpha_orig, beta_orig,
+                   self.move_key(state, best))
+        self.depth_cutoff = self.depth_cutoff or outer_cutoff
+        return value
 
-    def select_best_branch(self, tree):
-        curr_loc = tree.nodes[0]['state'].locations[self.aid][1]
-        move_to = -1
-        if self.aid == 0:  # Max player
-            best = -math.inf
-            for s in tree.successors(0):
-                if tree.nodes[s]['value'] > best:
-                    best = tree.nodes[s]['value']
-                    move_to = tree.nodes[s]['state'].locations[self.aid][1]
+    def alphabeta_in_place(self, state, depth, alpha, beta, node=None):
+        """
+        The same search as alphabeta, on the state itself: every successor is made on it and unmade after its subtree
+        is searched, so the state is as it was when this returns (but not when the search runs out of budget)
+        :param node: Not used, the tree is not recorded in place
+        :return: Value of the state
+        """
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_budget()
+        if depth == 0 or state.is_state_terminal():
+            if depth == 0:
+                self.depth_cutoff = True
+            return self.evaluate(state)
+        alpha_orig, beta_orig = alpha, beta
+        outer_cutoff = self.depth_cutoff
+        self.depth_cutoff = False
+        first = None
+        table = self.transposition_table
+        if table is not None:
+            entry = table.probe(state.zobrist_hash)
+            if entry is not None:
+                first = entry[4]
+                if entry[1] >= depth:
+                    self.depth_cutoff = entry[1] != tt.COMPLETE
+                    if entry[3] == tt.EXACT:
+                        alpha = beta = entry[2]
+                    elif entry[3] == tt.LOWER:
+                        alpha = max(alpha, entry[2])
+                    else:
+                        beta = min(beta, entry[2])
+                    if alpha >= beta:
+                        self.depth_cutoff = self.depth_cutoff or outer_cutoff
+                        return entry[2]
+        best = None
+        actions = self.first_action(self.legal_actions(state), first)
+        if state.agent_turn == 0:  # Max player
+            value = -math.inf
+            for action in actions:
+                undo = state.make(action)
+                s_value = self.alphabeta_in_place(state, depth - 1, alpha, beta)
+                state.unmake(undo)
+                if s_value > value:
+                    value = s_value
+                    best = action
+                alpha = max(value, alpha)
+                if alpha >= beta:
+                    if self.stats is not None:
+                        self.stats.cutoffs += 1
+                    break
         else:  # Min player
-            best = math.inf
-            for s in tree.successors(0):
-                if tree.nodes[s]['value'] < best:
-                    best = tree.nodes[s]['value']
-                    move_to = tree.nodes[s]['state'].locations[self.aid][1]
-        if move_to != -1:  # Moving to -1 means terminating
-            action = ("move", curr_loc, move_to)
+            value = math.inf
+            for action in actions:
+                undo = state.make(action)
+                s_value = self.alphabeta_in_place(state, depth - 1, alpha, beta)
+                state.unmake(undo)
+                if s_value < value:
+                    value = s_value
+                    best = action
+                beta = min(value, beta)
+                if alpha >= beta:
+                    if self.stats is not None:
+                        self.stats.cutoffs += 1
+                    break
+        self.store(state, depth if self.depth_cutoff else tt.COMPLETE, value, alpha_orig, beta_orig, best)
+        self.depth_cutoff = self.depth_cutoff or outer_cutoff
+        return value
+
+    def store(self, state, depth, value, alpha, beta, best_move=None):
+        """
+        :param alpha: Alpha the node was searched with
+        :param beta: Beta the node was searched with
+        Saves the value of a searched node in the transposition table along with the kind of bound it is
+        """
+        if self.transposition_table is None:
+            return
+        if value <= alpha:
+            bound = tt.UPPER
+        elif value >= beta:
+            bound = tt.LOWER
         else:
-            action = ("terminate",)
-        return action
+            bound = tt.EXACT
+        self.transposition_table.store(state.zobrist_hash, depth, value, bound, best_move)
 
 
 def adversarial_heuristic(state):
@@ -11,3 +11,20 @@ class Agent:
 
     def observe(self, state):
         return state
+
+    def get_action(self, state, best):
+        """
+        :param state: Current state
+        :param best: The chosen successor state, None if there is none
+        :return: The action which when taken in the current state leads to the chosen successor
+        """
+        move_to = best.locations[self.aid][1] if best is not None else -1
+        if move_to != -1:  # Moving to -1 means terminating
+            return ("move", state.locations[self.aid][1], move_to)
+        return ("terminate",)
+
+    def close(self):
+        """
+        Releases the resources of the agent when the game is over
+        """
+        pass
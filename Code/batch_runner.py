@@ -0,0 +1,128 @@
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from graph_reader import GraphReader
+from simulator import Simulator
+
+RESULT_FIELDS = ['graph', 'game_type', 'search', 'depth', 'time_budget', 'starts', 'agent_options', 'state_options',
+                 'scores', 'rounds', 'final_time', 'agent_times', 'search_stats', 'wall_time', 'error']
+
+
+def expand_configs(configs):
+    """
+    :param configs: Game configs, each one is a dictionary with a graph file, a game type, start vertices and a depth,
+    or a list of depths to play one game per depth. Optional keys: search ("minimax", "mcts" or "exact", see
+    make_agents), time_budget and agent_options (more agent arguments, {"stats": true} adds the search statistics to
+    the results, MCTS takes e.g. {"iterations": 500}). The depth of MCTS is the most plies it simulates, null for no
+    limit. state_options are the State options of the search, e.g. {"macro_steps": true, "prune_unreachable": true},
+    the defaults for the options not given. record is a file to record the game in (see GameRecorder) and events a
+    file to write the events of the game to (see GameOutput), "{depth}" in them is replaced by the game's depth
+    :return: One config per game
+    """
+    games = []
+    for config in configs:
+        depths = config.get('depths', config.get('depth'))
+        if not isinstance(depths, list):
+            depths = [depths]
+        for depth in depths:
+            game = {key: value for key, value in config.items() if key != 'depths'}
+            game['depth'] = depth
+            games.append(game)
+    return games
+
+
+def run_game(config):
+    """
+    Plays one game without any console output
+    :return: Dictionary of the results of the game
+    """
+    # Missing keys are read with get() here, the game then fails in the try below and is recorded as failed
+    result = {'graph': config.get('graph'), 'game_type': config.get('game_type'),
+              'search': config.get('search', 'minimax'), 'depth': config.get('depth'),
+              'time_budget': config.get('time_budget'), 'starts': config.get('starts'),
+              'agent_options': config.get('agent_options', {}), 'state_options': config.get('state_options', {})}
+    start = time.perf_counter()
+    try:
+        graph, deadline = GraphReader().read(config['graph'], verbose=False, csr=True)
+        search_args = dict(config.get('agent_options', {}), depth=config.get('depth'))
+        if config.get('time_budget') is not None:
+            search_args['time_budget'] = config['time_budget']
+        record, events = config.get('record'), config.get('events')
+        simulator = Simulator(interactive=False, verbose=False,
+                              record=record.format(depth=config.get('depth')) if record else None,
+                              events=events.format(depth=config.get('depth')) if events else None)
+        # Every game sets all the options, games played before it in the same process may have changed them
+        simulator.setup(graph, deadline, config['game_type'], config['starts'], result['search'],
+                        result['state_options'], **search_args)
+        simulator.run_environment()
+        result.update(scores=list(simulator.state.scores), rounds=simulator.num_rounds,
+                      final_time=simulator.state.current_time, agent_times=simulator.agent_times,
+                      search_stats=simulator.search_stats(), error=None)
+    except Exception as e:  # One broken config should not stop the whole batch
+        result.update(scores=None, rounds=None, final_time=None, agent_times=None, search_stats=None, error=repr(e))
+    result['wall_time'] = time.perf_counter() - start
+    return result
+
+
+def run_batch(configs, workers=None):
+    """
+    :param configs: Game configs (see expand_configs)
+    :param workers: Number of worker processes, None for the number of CPUs
+    :return: The results of the games in the order of the configs
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_game, expand_configs(configs)))
+
+
+def read_configs(path):
+    """
+    Reads configs from a JSONL file (one config per line) or a CSV file with the columns graph, game_type, depths
+    (separated by spaces), start0, start1 and optionally time_budget, search and the State options prune_unreachable
+    and macro_steps (1 or true to turn them on)
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            configs = []
+            for row in csv.DictReader(f):
+                config = {'graph': row['graph'], 'game_type': row['game_type'],
+                          'depths': [int(depth) for depth in row['depths'].split()],
+                          'starts': [int(row['start0']), int(row['start1'])]}
+                if row.get('time_budget'):
+                    config['time_budget'] = float(row['time_budget'])
+                if row.get('search'):
+                    config['search'] = row['search']
+                for option in ['prune_unreachable', 'macro_steps']:
+                    if row.get(option):
+                        config.setdefault('state_options', {})[option] = row[option].strip().lower() in ['1', 'true']
+                configs.append(config)
+            return configs
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_results(results, path):
+    """
+    Writes the results as CSV if the path ends with .csv, otherwise as JSONL
+    """
+    with open(path, 'w', newline='') as f:
+        if path.endswith('.csv'):
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            for result in results:
+                writer.writerow({key: json.dumps(value) if isinstance(value, (list, dict)) else value
+                                 for key, value in result.items()})
+        else:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play many games without console I/O')
+    parser.add_argument('configs', help='JSONL or CSV file of game configs')
+    parser.add_argument('-o', '--output', default='results.jsonl', help='Results file (.jsonl or .csv)')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    args = parser.parse_args()
+    write_results(run_batch(read_configs(args.configs), args.workers), args.output)
@@ -0,0 +1,126 @@
+import numpy as np
+
+MAX_FRONTIER = 2 ** 22  # Most states in one level of a batched search
+
+
+class FrontierTooLarge(Exception):
+    """
+    Raised when a level of the batched search would hold more than the allowed number of states
+    """
+    pass
+
+
+def search_values(states, depth, graph, on_level=None, max_frontier=MAX_FRONTIER):
+    """
+    Cooperative full-width search of several states at once, level by level. A level is a whole frontier of states held
+    in arrays (locations, people left in the nodes that had people, scores), which is expanded and scored with
+    vectorised operations, and the values are then reduced back up level by level. It follows State.expand() exactly,
+    macro steps included, so every state gets the value of CooperativeAgent.expand_minimax_tree without branch and
+    bound.
+    :param states: States of the same turn (e.g. the successors of a root)
+    :param depth: Remaining depth of the states
+    :param graph: The CSRGraph of the game
+    :param on_level: Called with the number of states of every level before it is expanded, may raise to stop the
+    search
+    :param max_frontier: Most states in one level, FrontierTooLarge is raised if a level is larger
+    :return: (list of the values of the states, whether the search was cut off anywhere by the depth)
+    """
+    first = states[0]
+    num_agents = len(first.locations)
+    deadline = first.deadline
+    turn = first.agent_turn
+    # Only the nodes which have people in some state can have people in their successors
+    people_nodes = np.flatnonzero(np.any([s.node_values for s in states], axis=0))
+    people_index = np.full(graph.number_of_nodes() + 1, -1)  # The last slot is for node -1
+    people_index[people_nodes] = np.arange(len(people_nodes))
+    locations = np.array([s.locations for s in states], dtype=np.int64).reshape(len(states), num_agents, 3)
+    people = np.array([[s.node_values[i] for i in people_nodes] for s in states], dtype=np.int64).reshape(
+        len(states), len(people_nodes))
+    scores = np.array([s.scores for s in states], dtype=np.int64).reshape(len(states), num_agents)
+    times = np.array([s.current_time for s in states], dtype=np.int64)  # With macro steps the times of a level differ
+    degrees = np.diff(graph.pointers)
+    levels = []  # Per level: (values of the level's states, indices of the expanded states, start of their children)
+    depth_cutoff = False
+    for level in range(depth + 1):
+        count = len(locations)
+        if on_level is not None:
+            on_level(count)
+        values = scores.sum(axis=1)
+        expanded = np.flatnonzero(~is_terminal(locations, people, times, deadline))
+        if level == depth:
+            depth_cutoff = len(expanded) > 0
+            break
+        if len(expanded) == 0:
+            break
+        locations, people, scores, times = locations[expanded], people[expanded], scores[expanded], times[expanded]
+        # Every state has one child, except when the agent in turn is on a node and decides: one child per neighbour in
+        # the graph order, and termination last
+        orig, dest, steps = locations[:, turn, 0], locations[:, turn, 1], locations[:, turn, 2]
+        deciding = (orig != -1) & (steps == 0)
+        num_children = np.where(deciding, degrees[dest] + 1, 1)
+        total = int(num_children.sum())
+        if total > max_frontier:
+            raise FrontierTooLarge()
+        starts = np.cumsum(num_children) - num_children
+        parents = np.repeat(np.arange(len(expanded)), num_children)
+        child_index = np.arange(total) - starts[parents]
+        levels.append((values, expanded, starts))
+        locations, people, scores, times = locations[parents], people[parents], scores[parents], times[parents]
+        child_deciding = deciding[parents]
+        child_dest = dest[parents]
+        moves = child_deciding & (child_index < degrees[child_dest])
+        edges = graph.pointers[child_dest[moves]] + child_index[moves]
+        locations[moves, turn] = np.stack([child_dest[moves], graph.neighbours[edges], graph.weights[edges]], axis=1)
+        locations[child_deciding & ~moves, turn] = (-1, -1, 0)
+        turn += 1
+        if turn == num_agents:
+            turn = 0
+            end_rounds(locations, people, scores, times, np.ones(len(times), dtype=np.int64), deadline, people_index)
+            if first.macro_steps:
+                end_rounds(locations, people, scores, times, rounds_to_skip(locations, people, times, deadline),
+                           deadline, people_index)
+    # Reduce from the deepest level up, an expanded state gets the best value of its children
+    for level_values, expanded, starts in reversed(levels):
+        level_values[expanded] = np.maximum.reduceat(values, starts)
+        values = level_values
+    return values.tolist(), depth_cutoff
+
+
+def is_terminal(locations, people, times, deadline):
+    """
+    :return: Which states of a level are terminal, as State.is_state_terminal()
+    """
+    terminal = (people.sum(axis=1) == 0) | (locations[:, :, 0] == -1).all(axis=1)
+    if deadline > 0:
+        terminal |= times >= deadline
+    return terminal
+
+
+def rounds_to_skip(locations, people, times, deadline):
+    """
+    :return: The number of rounds every state of a level skips with macro steps, as State.rounds_to_skip()
+    """
+    steps = locations[:, :, 2]
+    waiting = ((steps > 0) | (locations[:, :, 1] == -1)).all(axis=1) & ~is_terminal(locations, people, times, deadline)
+    rounds = np.where(steps > 0, steps, np.iinfo(np.int64).max).min(axis=1)
+    if deadline > 0:
+        rounds = np.minimum(rounds, np.ceil(deadline - times).astype(np.int64))
+    return np.where(waiting, rounds, 0)
+
+
+def end_rounds(locations, people, scores, times, rounds, deadline, people_index):
+    """
+    Plays the end of a round in every state of a level in place, in the order of State.end_round(): time, moving agents
+    and then people
+    :param rounds: Number of rounds to play in every state, 0 leaves a state as it is
+    """
+    times += rounds
+    steps = locations[:, :, 2]
+    steps -= np.where(steps > 0, rounds[:, None], 0)
+    rows = np.flatnonzero((rounds > 0) & (times <= deadline))
+    for aid in range(locations.shape[1]):
+        at = np.where(locations[rows, aid, 2] == 0, people_index[locations[rows, aid, 1]], -1)
+        has_people = at != -1
+        collecting, nodes = rows[has_people], at[has_people]
+        scores[collecting, aid] += people[collecting, nodes]
+        people[collecting, nodes] = 0
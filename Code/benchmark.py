@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import graph_util
+from csr_graph import CSRGraph
+from exact_solver import ExactSolver, SolverBudgetExceeded
+from graph_generator import GraphGenerator
+from graph_reader import GraphReader
+from simulator import default_state_options, make_agents
+from state import State
+
+# (number of nodes, number of edges) of the generated graphs, in increasing size and density
+CORPUS_SIZES = [(8, 10), (12, 20), (16, 32), (20, 50), (25, 75), (30, 110)]
+DEADLINE = 10
+GAME_TYPES = ['a', 's', 'c']
+DEPTHS = [2, 4, 6]
+# Options of the agents whose decisions are the baseline: the plain search, without the transposition table, pruning
+# or move ordering, which must not change the decisions
+REFERENCE_OPTIONS = {'a': {'tt_size': 0}, 's': {'tt_size': 0}, 'c': {'tt_size': 0, 'branch_and_bound': False}}
+OBJECTIVES = {'a': 'adversarial', 's': 'semicoop', 'c': 'coop'}  # Objective of the exact solver per game type
+# Most positions the exact solver solves per graph and game type (about 15 seconds), decisions it can not grade within
+# it are reported as ungraded
+EXACT_BUDGET = 200000
+
+
+def generate_corpus(directory, sizes=CORPUS_SIZES, deadline=DEADLINE, seed=0):
+    """
+    Writes one graph file per size, the same seed always generates the same corpus
+    :return: List of the file paths
+    """
+    paths = []
+    for num_nodes, num_edges in sizes:
+        path = os.path.join(directory, f'graph_{num_nodes}_{num_edges}_{seed}.txt')
+        GraphGenerator(f'{seed}:{num_nodes}:{num_edges}').generate_graph(path, num_nodes, num_edges, deadline)
+        paths.append(path)
+    return paths
+
+
+def sample_positions(graph, deadline, num_positions, seed=0):
+    """
+    :return: The start state and states reached from it by random moves, each one a decision of the agent in turn
+    """
+    rng = random.Random(seed)
+    State.graph = CSRGraph.from_graph(graph)
+    locs = rng.sample(range(State.graph.number_of_nodes()), 2)
+    state = State(graph_util.graph_to_node_value_list(State.graph), [[loc, loc, 0] for loc in locs], deadline=deadline)
+    state.update_people_and_scores()
+    positions = [state]
+    while len(positions) < num_positions and not state.is_state_terminal():
+        successors = state.expand()
+        # Termination is the last successor, do not pick it so the game goes on
+        state = rng.choice(successors[:-1] if len(successors) > 1 else successors)
+        if not state.is_state_terminal() and not state.is_agent_moving(state.agent_turn) and \
+                not state.is_agent_terminated(state.agent_turn):
+            positions.append(state)
+    return positions
+
+
+def decide(game_type, depth, state, options, memory=False, state_options=None):
+    """
+    Runs one decision of the agent in turn
+    :param memory: Also run the decision again under tracemalloc to measure its peak memory
+    :param state_options: State options of the search which replace the defaults (see State.set_options)
+    :return: (action, nodes searched, seconds, peak memory in KiB or None)
+    """
+    State.set_options(dict(default_state_options, **(state_options or {})))
+    _, agents = make_agents(game_type, depth=depth, **options)
+    agent = agents[state.agent_turn]
+    start = time.perf_counter()
+    action = agent.act(state.copy())
+    seconds = time.perf_counter() - start
+    nodes = agent.nodes
+    agent.close()
+    peak = None
+    if memory:
+        # tracemalloc slows the search down, so the time is measured without it. The decision is run again by a new
+        # agent, the first one would start from what it kept of the first search (its transposition table)
+        _, agents = make_agents(game_type, depth=depth, **options)
+        agent = agents[state.agent_turn]
+        tracemalloc.start()
+        agent.act(state.copy())
+        peak = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+        agent.close()
+    return list(action), nodes, seconds, peak
+
+
+def grade(solver, state, action):
+    """
+    Grades a decision of the agent in turn against optimal play
+    :return: (the optimal action, whether the action is as good as it, the people the agent loses by the action)
+    """
+    keys = [(move, solver.key(value, state.agent_turn)) for move, value in solver.action_values(state)]
+    best, best_key = keys[0]
+    for move, key in keys:
+        if key > best_key:
+            best, best_key = move, key
+    key = dict(keys)[tuple(action)]
+    if isinstance(key, tuple):  # Semi-cooperative keys are (own score, other score), the agent loses own score
+        return list(best), key == best_key, best_key[0] - key[0]
+    return list(best), key == best_key, best_key - key
+
+
+def run_benchmark(paths, game_types=GAME_TYPES, depths=DEPTHS, num_positions=3, agent_options=None, memory=True,
+                  seed=0, exact=False, state_options=None, exact_budget=EXACT_BUDGET):
+    """
+    :param paths: Graph files
+    :param agent_options: Options of the benchmarked agents per game type, their decisions are compared with the ones
+    of the agents with REFERENCE_OPTIONS
+    :param state_options: State options of the benchmarked searches (see State.set_options), the reference searches
+    and the sampling of the positions use the defaults
+    :param exact: Also grade every decision against optimal play, found by an ExactSolver
+    :param exact_budget: Most positions the solver of a graph and game type solves, None for no limit. A decision
+    that needs more is not graded, its result has the reason as "ungraded"
+    :return: One result per graph, game type, depth and position
+    """
+    agent_options = agent_options or {}
+    results = []
+    for path in paths:
+        graph, deadline = GraphReader().read(path, verbose=False, csr=True)
+        State.set_options(default_state_options)
+        positions = sample_positions(graph, deadline, num_positions, seed)
+        for game_type in game_types:
+            # All the positions are from the same game, so they share a solver and everything it solved
+            solver = None
+            if exact:
+                solver = ExactSolver(OBJECTIVES[game_type], State.graph, positions[0].node_values, deadline,
+                                     exact_budget)
+            for depth in depths:
+                for i, state in enumerate(positions):
+                    options = agent_options.get(game_type, {})
+                    action, nodes, seconds, peak = decide(game_type, depth, state, options, memory, state_options)
+                    reference = decide(game_type, depth, state, REFERENCE_OPTIONS[game_type])[0]
+                    results.append({'graph': os.path.basename(path), 'num_nodes': graph.number_of_nodes(),
+                                    'num_edges': graph.number_of_edges(), 'game_type': game_type, 'depth': depth,
+                                    'position': i, 'action': action, 'reference_action': reference,
+                                    'agrees': action == reference, 'nodes': nodes, 'seconds': seconds,
+                                    'nodes_per_sec': nodes / seconds if seconds > 0 else None, 'peak_kib': peak})
+                    if solver is not None:
+                        try:
+                            optimal_action, optimal, loss = grade(solver, state, action)
+                        except SolverBudgetExceeded as e:
+                            results[-1].update(optimal_action=None, optimal=None, loss=None, ungraded=str(e))
+                        else:
+                            results[-1].update(optimal_action=optimal_action, optimal=optimal, loss=loss)
+    return results
+
+
+def compare_with_baseline(results, baseline):
+    """
+    :param baseline: Results of an earlier run
+    :return: Changed decisions and the speedup over the baseline (its time divided by ours), per game type and depth
+    """
+    key = ('graph', 'game_type', 'depth', 'position')
+    earlier = {tuple(r[k] for k in key): r for r in baseline}
+    changed = []
+    speed = {}
+    for result in results:
+        old = earlier.get(tuple(result[k] for k in key))
+        if old is None:
+            continue
+        if old['action'] != result['action']:
+            changed.append({k: result[k] for k in key} | {'action': result['action'], 'baseline_action': old['action']})
+        old_time, new_time = speed.get((result['game_type'], result['depth']), (0, 0))
+        speed[(result['game_type'], result['depth'])] = (old_time + old['seconds'], new_time + result['seconds'])
+    return {'changed_decisions': changed,
+            'speedup': {f'{game_type}{depth}': old_time / new_time
+                        for (game_type, depth), (old_time, new_time) in speed.items() if new_time > 0}}
+
+
+def summarize(results):
+    """
+    :return: Totals per game type and depth
+    """
+    summary = {}
+    for result in results:
+        total = summary.setdefault(f'{result["game_type"]}{result["depth"]}',
+                                   {'decisions': 0, 'agreements': 0, 'nodes': 0, 'seconds': 0.0, 'peak_kib': None})
+        total['decisions'] += 1
+        total['agreements'] += result['agrees']
+        total['nodes'] += result['nodes']
+        total['seconds'] += result['seconds']
+        if result['peak_kib'] is not None:
+            total['peak_kib'] = max(total['peak_kib'] or 0, result['peak_kib'])
+        if 'optimal' in result:
+            total.setdefault('optimal', 0)
+            total.setdefault('loss', 0)
+            total.setdefault('ungraded', 0)
+            if result['optimal'] is None:
+                total['ungraded'] += 1
+            else:
+                total['optimal'] += result['optimal']
+                total['loss'] += result['loss']
+    for total in summary.values():
+        total['nodes_per_sec'] = total['nodes'] / total['seconds'] if total['seconds'] > 0 else None
+        total['seconds_per_act'] = total['seconds'] / total['decisions']
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the search agents on generated graphs')
+    parser.add_argument('-o', '--output', default='benchmark.json', help='Results file (JSON)')
+    parser.add_argument('-d', '--depths', type=int, nargs='+', default=DEPTHS)
+    parser.add_argument('-g', '--game-types', nargs='+', default=GAME_TYPES, choices=GAME_TYPES)
+    parser.add_argument('-p', '--positions', type=int, default=3, help='Number of positions per graph')
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--corpus', help='Directory to keep the generated graphs in, a temporary one if not given')
+    parser.add_argument('--baseline', help='Results file of an earlier run to compare with')
+    parser.add_argument('--options', default='{}',
+                        help='JSON of agent options per game type, e.g. {"a": {"tt_size": 1024}}')
+    parser.add_argument('--state-options', default='{}',
+                        help='JSON of State options of the benchmarked searches, e.g. {"macro_steps": true}')
+    parser.add_argument('--no-memory', action='store_true', help='Do not measure peak memory (halves the run time)')
+    parser.add_argument('--exact', action='store_true', help='Grade the decisions against optimal play')
+    parser.add_argument('--exact-budget', type=int, default=EXACT_BUDGET,
+                        help='Most positions the exact solver solves per graph and game type, 0 for no limit')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        if args.corpus:
+            os.makedirs(args.corpus, exist_ok=True)
+        paths = generate_corpus(args.corpus or directory, seed=args.seed)
+        results = run_benchmark(paths, args.game_types, args.depths, args.positions, json.loads(args.options),
+                                not args.no_memory, args.seed, args.exact, json.loads(args.state_options),
+                                args.exact_budget or None)
+    report = {'seed': args.seed, 'depths': args.depths, 'state_options': json.loads(args.state_options),
+              'summary': summarize(results), 'results': results}
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['baseline'] = compare_with_baseline(results, json.load(f)['results'])
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    for name, total in report['summary'].items():
+        optimal = ''
+        if 'optimal' in total:
+            graded = total['decisions'] - total['ungraded']
+            optimal = f', {total["optimal"]}/{graded} optimal' + (f' ({total["ungraded"]} ungraded)'
+                                                                  if total['ungraded'] else '')
+        print(f'{name}: {total["nodes_per_sec"]:.0f} nodes/sec, {total["seconds_per_act"]:.4f} sec/act, '
+              f'{total["agreements"]}/{total["decisions"]} agree{optimal}')
@@ -1,63 +1,219 @@
 import math
 
-import networkx as nx
-
+import batched_search
+import graph_util
+import transposition_table as tt
 from multiplayer_agent import MultiplayerAgent
 
 
 class CooperativeAgent(MultiplayerAgent):
-    def __init__(self, depth):
-        super().__init__(depth)
+    def __init__(self, depth, branch_and_bound=True, backend='recursive', **kwargs):
+        """
+        :param depth: Cutoff depth of the search
+        :param branch_and_bound: Skip subtrees whose upper bound can not beat the best value found so far
+        :param backend: 'recursive' searches one state at a time, 'batched' searches the subtree of every root successor
+        level by level with NumPy (see batched_search), which is faster per node but searches the full width. Both make
+        the same decisions. The batched search does not use the transposition table, the move ordering or branch and
+        bound, and the tree is not recorded with it
+        :param kwargs: Search options of MultiplayerAgent
+        """
+        super().__init__(depth, **kwargs)
+        if backend not in ['recursive', 'batched']:
+            raise ValueError('Search backend not recognized')
         self.heuristic = cooperative_heuristic
+        self.branch_and_bound = branch_and_bound
+        self.backend = backend
+
+    def search_root(self, state, depth, node=None, first=None):
+        if self.backend == 'batched' and node is None:
+            self.nodes += 1
+            successors = self.expand(state)
+            if not successors:
+                return None
+            values = self.batched_values(successors, depth - 1)
+            return successors[values.index(max(values))]  # The first best one
+        best = None
+        best_value = -math.inf
+        best_index = math.inf
+        self.nodes += 1
+        search = self.expand_minimax_tree_in_place if self.search_in_place else self.expand_minimax_tree
+        successors = self.expand(state)
+        index = {id(s): i for i, s in enumerate(successors)}
+        for s in self.order_successors(state, successors, first):
+            i = index[id(s)]
+            # A child that comes before the best one in State.expand() wins a tie, so it must not be cut off when it can
+            # only equal the best value
+            bound = math.nextafter(best_value, -math.inf) if i < best_index else best_value
+            value = search(s, depth - 1, self.record_child(node, state, s), bound)
+            if value > best_value or (value == best_value and i < best_index):
+                best_value = value
+                best, best_index = s, i
+        self.record_value(node, best_value)
+        return best
+
+    def search_child(self, child, depth, bound):
+        if self.backend == 'batched':
+            return self.batched_values([child], depth - 1)[0]
+        search = self.expand_minimax_tree_in_place if self.search_in_place else self.expand_minimax_tree
+        return search(child, depth - 1, None, math.nextafter(bound, -math.inf))
 
-    def act(self, state):
-        if state.is_agent_moving(self.aid):
-            return ("noop",)
-        self.vertex_id = 0
-        tree = nx.DiGraph()
-        tree.add_node(self.vertex_id, state=state)
-        self.vertex_id += 1
-        self.expand_minimax_tree(tree, 0, self.depth)
-        self.num_call += 1
-        return self.select_best_branch(tree)
-
-    def expand_minimax_tree(self, tree, node, depth):
-        """
-        :param tree: The tree we're constructing
-        :param node: The id (int) of the root of the current subtree
+    def batched_values(self, states, depth):
+        """
+        :param states: States of the same time and turn
+        :return: List of the values of the states, searched by the batched backend. If a level of the search gets too
+        large they are searched one by one instead
+        """
+        try:
+            values, depth_cutoff = batched_search.search_values(states, depth, states[0].graph, self.count_level)
+        except batched_search.FrontierTooLarge:
+            return [self.expand_minimax_tree(s, depth) for s in states]
+        self.depth_cutoff = self.depth_cutoff or depth_cutoff
+        return values
+
+    def count_level(self, count):
+        self.nodes += count
+        if self.nodes >= self.next_check:
+            self.check_budget()
+
+    def expand_minimax_tree(self, state, depth, node=None, bound=-math.inf):
+        """
+        :param state: The state at the root of the current subtree
         :param depth: Depth of search tree
-        :return: Value of root node
+        :param node: The id (int) of the root of the current subtree in the recorded search tree, None if not recording
+        :param bound: The best value found so far, a subtree that can not beat it is not searched
+        :return: Value of root node, or an upper bound of it if it is not more than bound
         Both players are trying to maximize the score which is the sum of their scores
         """
-        state = tree.nodes[node]['state']
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_budget()
         if depth == 0 or state.is_state_terminal():
-            tree.nodes[node]['value'] = self.heuristic(state)
-            return self.heuristic(state)
+            if depth == 0:
+                self.depth_cutoff = True
+            value = self.evaluate(state)
+            self.record_value(node, value)
+            return value
+        # A subtree that was searched before is either exact or an upper bound, which prunes like branch and bound
+        first = None
+        table = self.transposition_table
+        if table is not None:
+            entry = table.probe(state.zobrist_hash)
+            if entry is not None:
+                first = entry[4]
+                if entry[1] >= depth and (entry[3] == tt.EXACT or entry[2] <= bound):
+                    self.depth_cutoff = self.depth_cutoff or entry[1] != tt.COMPLETE
+                    self.record_value(node, entry[2])
+                    return entry[2]
+        if self.branch_and_bound and bound > -math.inf:
+            upper = cooperative_upper_bound(state, depth, bound)
+            if upper <= bound:
+                # When the bound only holds up to the search depth, the subtree may go on after the cutoff
+                if state.deadline <= 0 or search_horizon(state, depth) < state.deadline - state.current_time:
+                    self.depth_cutoff = True
+                if self.stats is not None:
+                    self.stats.cutoffs += 1
+                self.record_value(node, upper)
+                return upper
+        outer_cutoff = self.depth_cutoff
+        self.depth_cutoff = False
+        bound_orig = bound
         value = -math.inf
-        for s in state.expand():
-            tree.add_node(self.vertex_id, state=s)
-            tree.add_edge(node, self.vertex_id, label=self.get_edge_label(state, s))
-            self.vertex_id += 1
-            value = max(value, self.expand_minimax_tree(tree, self.vertex_id - 1, depth - 1))
-        tree.nodes[node]['value'] = value
+        best = None
+        for s in self.successors(state, first, self.root_depth - depth):
+            s_value = self.expand_minimax_tree(s, depth - 1, self.record_child(node, state, s), bound)
+            if s_value > value:
+                value = s_value
+                best = s
+            bound = max(bound, value)
+        self.record_value(node, value)
+        if table is not None:
+            # Every child that could be better than the bound was searched exactly, so a value above it is exact
+            table.store(state.zobrist_hash, depth if self.depth_cutoff else tt.COMPLETE, value,
+                        tt.EXACT if value > bound_orig else tt.UPPER, self.move_key(state, best))
+        self.depth_cutoff = self.depth_cutoff or outer_cutoff
         return value
 
-    def select_best_branch(self, tree):
-        curr_loc = tree.nodes[0]['state'].locations[self.aid][1]
-        move_to = -1
-        best = -math.inf
-        for s in tree.successors(0):
-            if tree.nodes[s]['value'] > best:
-                best = tree.nodes[s]['value']
-                move_to = tree.nodes[s]['state'].locations[self.aid][1]
-        if move_to != -1:
-            action = ("move", curr_loc, move_to)
-        else:
-            action = ("terminate",)
-        return action
+    def expand_minimax_tree_in_place(self, state, depth, node=None, bound=-math.inf):
+        """
+        The same search as expand_minimax_tree, on the state itself: every successor is made on it and unmade after its
+        subtree is searched, so the state is as it was when this returns (but not when the search runs out of budget)
+        :param node: Not used, the tree is not recorded in place
+        :return: Value of the state, or an upper bound of it if it is not more than bound
+        """
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_budget()
+        if depth == 0 or state.is_state_terminal():
+            if depth == 0:
+                self.depth_cutoff = True
+            return self.evaluate(state)
+        first = None
+        table = self.transposition_table
+        if table is not None:
+            entry = table.probe(state.zobrist_hash)
+            if entry is not None:
+                first = entry[4]
+                if entry[1] >= depth and (entry[3] == tt.EXACT or entry[2] <= bound):
+                    self.depth_cutoff = self.depth_cutoff or entry[1] != tt.COMPLETE
+                    return entry[2]
+        if self.branch_and_bound and bound > -math.inf:
+            upper = cooperative_upper_bound(state, depth, bound)
+            if upper <= bound:
+                if state.deadline <= 0 or search_horizon(state, depth) < state.deadline - state.current_time:
+                    self.depth_cutoff = True
+                if self.stats is not None:
+                    self.stats.cutoffs += 1
+                return upper
+        outer_cutoff = self.depth_cutoff
+        self.depth_cutoff = False
+        bound_orig = bound
+        value = -math.inf
+        best = None
+        for action in self.first_action(self.legal_actions(state), first):
+            undo = state.make(action)
+            s_value = self.expand_minimax_tree_in_place(state, depth - 1, None, bound)
+            state.unmake(undo)
+            if s_value > value:
+                value = s_value
+                best = action
+            bound = max(bound, value)
+        if table is not None:
+            table.store(state.zobrist_hash, depth if self.depth_cutoff else tt.COMPLETE, value,
+                        tt.EXACT if value > bound_orig else tt.UPPER, best)
+        self.depth_cutoff = self.depth_cutoff or outer_cutoff
+        return value
 
 
 def cooperative_heuristic(state):
     p0_score = state.scores[0]
     p1_score = state.scores[1]
     return p0_score + p1_score
+
+
+def cooperative_upper_bound(state, depth, bound=-math.inf):
+    """
+    :param depth: Remaining depth of the search
+    :param bound: If the cheap bound is already not more than this, it is returned without computing the tight one
+    :return: An upper bound of the cooperative value the search can find below the state: the current score plus the
+    people in nodes that some agent can reach before the deadline and before the search depth runs out
+    """
+    upper = state.scores[0] + state.scores[1] + state.people_remaining()
+    if upper <= bound:
+        return upper
+    time_left = search_horizon(state, depth)
+    if state.deadline > 0:
+        time_left = min(time_left, state.deadline - state.current_time)
+    return state.scores[0] + state.scores[1] + graph_util.get_reachable_people_value(state.graph, state.node_values,
+                                                                                     state.locations, time_left)
+
+
+def search_horizon(state, depth):
+    """
+    :param depth: Remaining depth of the search
+    :return: The most time units the search can look ahead of the state. People are only collected at the end of a
+    round, and the search can only see the ends of the rounds within depth. With macro steps a round can last any
+    number of time units, so only the deadline limits it
+    """
+    if state.macro_steps:
+        return math.inf
+    return (depth + state.agent_turn) // 2
@@ -0,0 +1,160 @@
+import hashlib
+
+import numpy as np
+
+
+class CSRGraph:
+    """
+    An immutable graph in compressed sparse row form, the graph the game is played on (State.graph). Nodes are numbered
+    0 to n-1 and the neighbours of node u are neighbours[pointers[u]:pointers[u + 1]], with the weights and ids of the
+    edges at the same indices, in the same order networkx iterates them. The arrays are read-only, so they can be the
+    memory-mapped arrays of a binary graph file (see graph_reader.map_binary). Such a graph is pickled as the place of
+    its arrays in the file, so the processes it is sent to map the same pages instead of copying them.
+    The search reads adjacency[u], a tuple of (neighbour, weight) pairs per node, which is much faster to iterate from
+    Python than the arrays, and moves[u], the (u, neighbour, weight) location of an agent that sets out on each of
+    them. The tuples of a node are built the first time they are read (see Rows), a search only reads the nodes it
+    reaches. Values derived from the graph (shortest paths and distances, see graph_util) are cached on it.
+    """
+    __slots__ = ('pointers', 'neighbours', 'weights', 'eids', 'node_values', 'adjacency', 'moves', 'shortest_paths',
+                 'distance_rows', 'people_distances')
+
+    def __init__(self, pointers, neighbours, weights, eids, node_values):
+        """
+        :param pointers: CSR index pointers (n + 1)
+        :param neighbours: Neighbour of every edge end (2m)
+        :param weights: Weight of every edge end (2m)
+        :param eids: Edge id of every edge end (2m)
+        :param node_values: Number of people in every node at the start of the game
+        """
+        self.pointers = read_only(pointers)
+        self.neighbours = read_only(neighbours)
+        self.weights = read_only(weights)
+        self.eids = read_only(eids)
+        self.node_values = tuple(node_values)
+        self.shortest_paths = None  # (distances, next hops), see graph_util.get_shortest_paths
+        self.distance_rows = {}  # Source -> distances of a large graph, see graph_util.get_distance_row
+        self.people_distances = None  # (node values, distances), see graph_util.get_distances_to_people
+        self.adjacency = Rows(self.build_adjacency)
+        self.moves = Rows(self.build_moves)
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        :param graph: A networkx graph (or a CSRGraph, which is returned as is) whose nodes are numbered 0 to n-1. The
+        arrays of a graph loaded from a binary file are used without copying them
+        """
+        if isinstance(graph, CSRGraph):
+            return graph
+        arrays = graph.graph.get('csr')
+        if arrays is not None and np.array_equal(arrays['node_ids'], np.arange(len(arrays['node_ids']))):
+            return cls(arrays['pointers'], arrays['neighbours'], arrays['weights'], arrays['eids'],
+                       arrays['node_values'].tolist())
+        pointers = [0]
+        neighbours, weights, eids = [], [], []
+        for node in range(graph.number_of_nodes()):
+            for neighbour, data in graph[node].items():
+                neighbours.append(neighbour)
+                weights.append(data['weight'])
+                eids.append(data['eid'])
+            pointers.append(len(neighbours))
+        return cls(pointers, neighbours, weights, eids,
+                   [graph.nodes[node]['value'] for node in range(graph.number_of_nodes())])
+
+    def build_adjacency(self, u):
+        if not 0 <= u < self.number_of_nodes():
+            raise IndexError(f'No node {u}')
+        start, end = int(self.pointers[u]), int(self.pointers[u + 1])
+        return tuple(zip(self.neighbours[start:end].tolist(), self.weights[start:end].tolist()))
+
+    def build_moves(self, u):
+        return tuple((u, neighbour, weight) for neighbour, weight in self.adjacency[u])
+
+    def __getstate__(self):
+        # The rows are rebuilt as they are read, and mapped arrays are pickled as their place in the file
+        return (tuple(array_source(array) for array in [self.pointers, self.neighbours, self.weights, self.eids]),
+                self.node_values, self.shortest_paths)
+
+    def __setstate__(self, state):
+        arrays, node_values, shortest_paths = state
+        self.__init__(*[load_array(array) for array in arrays], node_values)
+        self.shortest_paths = shortest_paths
+
+    def digest(self):
+        """
+        :return: A hash (hex string) of everything about the graph the game depends on: the edges, their weights and
+        the people, in node and neighbour order. Edge ids are not part of it
+        """
+        h = hashlib.sha256()
+        for array in [self.pointers, self.neighbours, self.weights, np.asarray(self.node_values, dtype=np.int64)]:
+            h.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+        return h.hexdigest()
+
+    def number_of_nodes(self):
+        return len(self.pointers) - 1
+
+    def number_of_edges(self):
+        return len(self.neighbours) // 2
+
+    def get_neighbours(self, node):
+        return [neighbour for neighbour, weight in self.adjacency[node]]
+
+    def get_edge_weight(self, u, v):
+        for neighbour, weight in self.adjacency[u]:
+            if neighbour == v:
+                return weight
+        raise KeyError(f'No edge {u}-{v}')
+
+    def get_edge_id(self, u, v):
+        start = int(self.pointers[u])
+        for i in range(len(self.adjacency[u])):
+            if self.adjacency[u][i][0] == v:
+                return int(self.eids[start + i])
+        raise KeyError(f'No edge {u}-{v}')
+
+    def __str__(self):
+        return f'Graph with {self.number_of_nodes()} nodes and {self.number_of_edges()} edges'
+
+
+class Rows(dict):
+    """
+    The rows of a graph by node, each one built by a function of the node the first time it is read. Reading a row
+    that is built is a dictionary lookup
+    """
+    __slots__ = ('build',)
+
+    def __init__(self, build):
+        super().__init__()
+        self.build = build
+
+    def __missing__(self, u):
+        row = self[u] = self.build(u)
+        return row
+
+
+def read_only(array):
+    array = np.asarray(array, dtype=np.int64)
+    array.flags.writeable = False
+    return array
+
+
+def array_source(array):
+    """
+    :return: (file, offset, length) of an array which is a whole memory-mapped array of a file, otherwise the array
+    """
+    mapped = array
+    while mapped is not None and not isinstance(mapped, np.memmap):
+        mapped = mapped.base if isinstance(mapped, np.ndarray) else None
+    if mapped is None or mapped.filename is None or mapped.dtype != np.dtype('<i8') or mapped.size != array.size or \
+            mapped.ctypes.data != array.ctypes.data:
+        return array
+    return mapped.filename, mapped.offset, mapped.size
+
+
+def load_array(source):
+    """
+    :param source: An array or the (file, offset, length) of one (see array_source)
+    """
+    if isinstance(source, tuple):
+        filename, offset, length = source
+        return np.memmap(filename, dtype='<i8', mode='r', offset=offset, shape=(length,))
+    return source
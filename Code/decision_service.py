@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from csr_graph import CSRGraph
+from graph_reader import GraphReader
+from multiplayer_agent import MultiplayerAgent
+from simulator import make_agents
+from state import State
+
+AGENT_CACHE_SIZE = 32  # Agent pairs kept warm in every worker process
+DEADLINE_MARGIN = 0.005  # Seconds of a request's deadline left for sending the decision back
+LATENCY_WINDOW = 1000  # Number of recent requests the latency metrics are computed over
+LINE_LIMIT = 2 ** 24  # Longest request line in bytes
+
+# State of a worker process: graph id -> (CSRGraph, deadline, path, digest), and agent pairs by their settings
+graphs = {}
+agents = {}
+default_state_options = State.get_options()
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a request can not be answered before its deadline
+    """
+    pass
+
+
+def init_worker(paths):
+    """
+    Runs once in every worker process, which loads all the graphs known when it starts
+    :param paths: Dictionary of graph id to graph file
+    """
+    for graph_id, path in paths.items():
+        load_graph(graph_id, path)
+
+
+def load_graph(graph_id, path):
+    """
+    :return: (CSRGraph, deadline, path, digest) of the graph, read from the file the first time the graph is used
+    """
+    entry = graphs.get(graph_id)
+    if entry is None or entry[2] != path:
+        graph, deadline = GraphReader().read(path, verbose=False, csr=True)
+        graph = CSRGraph.from_graph(graph)
+        entry = graphs[graph_id] = (graph, deadline, path, graph.digest())
+    return entry
+
+
+def warm_up():
+    return os.getpid()
+
+
+def get_agents(request, digest, deadline):
+    """
+    :param digest: The digest of the request's graph (see CSRGraph.digest)
+    :param deadline: The deadline of the request's game
+    :return: The agent pair of the request's game and settings on the graph. Agents are kept between requests, so
+    they keep what they learned (transposition tables, move orderings, the exact solver's positions) for the next
+    decisions in the same game. Requests of other games get other agents, so one game does not change the decisions
+    of another
+    """
+    search_args = dict(request.get('agent_options', {}))
+    search = request.get('search', 'minimax')
+    if 'depth' in request:
+        search_args['depth'] = request['depth']
+    elif search == 'minimax':
+        search_args.setdefault('depth', None)  # Searched by iterative deepening within the budget, see decide
+    key = (json.dumps(request.get('game')), digest, deadline, request['game_type'], search,
+           json.dumps(search_args, sort_keys=True), json.dumps(request.get('state_options', {}), sort_keys=True))
+    pair = agents.pop(key, None)
+    if pair is None:
+        if len(agents) >= AGENT_CACHE_SIZE:  # Drop the least recently used
+            for agent in agents.pop(next(iter(agents))):
+                agent.close()
+        game_type, pair = make_agents(request['game_type'], search, **search_args)
+        if game_type == -1:
+            raise ValueError('Human agents can not be served')
+    agents[key] = pair  # Last in the order of use
+    return pair
+
+
+def decide(path, request, deadline):
+    """
+    Runs in a worker process
+    :param path: The file of the request's graph
+    :param request: An "act" request (see DecisionService)
+    :param deadline: time.time() by which the decision is needed, None for no deadline
+    :return: Dictionary of the action, the number of nodes the agent searched and the seconds it took
+    """
+    graph, graph_deadline, _, digest = load_graph(request['graph'], path)
+    State.graph = graph
+    State.set_options(dict(default_state_options, **request.get('state_options', {})))
+    state = State.from_dict(dict({'deadline': graph_deadline}, **request['state']))
+    aid = request.get('agent', state.agent_turn)
+    if aid != state.agent_turn:
+        raise ValueError(f'It is the turn of agent {state.agent_turn}, not of agent {aid}')
+    agent = get_agents(request, digest, state.deadline)[aid]
+    # A time budget makes the minimax agents search by iterative deepening (up to the depth) and stops MCTS, so they
+    # return the best decision they have when the deadline comes. The exact agents can not stop early
+    if hasattr(agent, 'time_budget'):
+        # The agents are shared by the requests with the same settings, so the budget is set on every request: the
+        # request's, or else the one the agent was built with
+        budget = request.get('time_budget')
+        if budget is None:
+            budget = request.get('agent_options', {}).get('time_budget')
+        if deadline is not None:
+            left = deadline - time.time() - DEADLINE_MARGIN
+            if left <= 0:
+                raise DeadlineExceeded('The deadline passed before the search started')
+            budget = left if budget is None else min(budget, left)
+        agent.time_budget = budget
+    elif deadline is not None and deadline <= time.time():
+        raise DeadlineExceeded('The deadline passed before the search started')
+    if isinstance(agent, MultiplayerAgent) and agent.depth is None and agent.time_budget is None and \
+            agent.node_budget is None:
+        raise ValueError('A minimax request needs a depth, a time budget or a deadline')
+    start = time.perf_counter()
+    action = agent.act(state)
+    return {'action': list(action), 'nodes': getattr(agent, 'nodes', None), 'seconds': time.perf_counter() - start}
+
+
+def latency_summary(samples):
+    """
+    :return: Count, mean, percentiles and maximum of the samples in seconds, None if there are none
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, math.ceil(p * len(ordered)) - 1)]
+
+    return {'count': len(ordered), 'mean': sum(ordered) / len(ordered), 'p50': percentile(0.5),
+            'p95': percentile(0.95), 'p99': percentile(0.99), 'max': ordered[-1]}
+
+
+class DecisionService:
+    """
+    Answers "what does the agent in turn do in this state" for many games at once, with the agents running in a pool
+    of worker processes which are started once, load the graphs once and keep their agents between requests.
+    Requests and responses are dictionaries (JSON objects, one per line on the wire), a response has the "id" of its
+    request and either its result or an "error". The "op" of a request is one of
+        'act' (the default) - keys: graph (a graph id), game_type, state (see State.to_dict, the deadline defaults to
+        the graph's), and optionally game (any JSON value which identifies the game, the requests of a game share
+        their agents and the agents of other games are not affected), agent (must be the agent in turn), search,
+        depth, time_budget, agent_options (as in the batch runner configs), state_options (see State.set_options) and
+        deadline (seconds from when the request is received). A minimax request without a depth searches by iterative
+        deepening and needs a time budget or a deadline. The result is the action of agent.act(), the nodes searched
+        and the seconds the search took
+        'load' - keys: graph and path, registers a graph file under the id, workers load it when first asked for it
+        'metrics' - the request counts, the number of requests queued for a worker and running, and the latency from
+        receiving a request to answering it, the time it was queued and the time a worker spent on it
+    A request that is still queued at its deadline is answered with an error without running it. A running search gets
+    the time left as its time budget, and the request is answered with an error at the deadline if the search is
+    still running (the worker finishes it, and only then takes the next request).
+    """
+
+    def __init__(self, paths=None, workers=None):
+        """
+        :param paths: Dictionary of graph id to graph file, the graphs every worker loads when it starts
+        :param workers: Number of worker processes, None for the number of CPUs
+        """
+        self.paths = dict(paths or {})
+        self.workers = workers or os.cpu_count()
+        self.executor = None
+        self.slots = None  # One per worker, a request holds one while it runs
+        self.requests = 0
+        self.completed = 0
+        self.errors = 0
+        self.deadline_misses = 0
+        self.queued = 0
+        self.running = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.queue_times = deque(maxlen=LATENCY_WINDOW)
+        self.service_times = deque(maxlen=LATENCY_WINDOW)
+
+    async def start(self):
+        """
+        Starts the workers and waits until they are ready
+        """
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                            initargs=(self.paths,))
+        self.slots = asyncio.Semaphore(self.workers)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, warm_up) for _ in range(self.workers)])
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    async def respond(self, request):
+        """
+        :return: The response to the request
+        """
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            op = request.get('op', 'act')
+            if op == 'act':
+                result = await self.act(request)
+            elif op == 'load':
+                self.paths[request['graph']] = request['path']
+                result = {'graph': request['graph']}
+            elif op == 'metrics':
+                result = self.metrics()
+            else:
+                raise ValueError(f'Operation {op} not recognized')
+        except Exception as e:  # One bad request should not stop the service
+            self.errors += 1
+            if isinstance(e, DeadlineExceeded):
+                self.deadline_misses += 1
+            return {'id': request_id, 'error': repr(e)}
+        return dict(result, id=request_id)
+
+    async def act(self, request):
+        received = time.perf_counter()
+        self.requests += 1
+        if request.get('graph') not in self.paths:
+            raise ValueError(f'Unknown graph {request.get("graph")}')
+        deadline = time.time() + request['deadline'] if request.get('deadline') is not None else None
+        self.queued += 1
+        # Every request waits for its slot in a task, so they get the workers in the order they came
+        acquire = asyncio.ensure_future(self.slots.acquire())
+        try:
+            await asyncio.wait_for(acquire, deadline - time.time() if deadline is not None else None)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded('The deadline passed while the request was queued') from None
+        finally:
+            self.queued -= 1
+        started = time.perf_counter()
+        self.queue_times.append(started - received)
+        self.running += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, decide, self.paths[request['graph']],
+                                                            request, deadline)
+        # The worker is busy until its search returns, even if the request is answered before that
+        future.add_done_callback(self.worker_done)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future),
+                                            deadline - time.time() if deadline is not None else None)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded('The search did not end before the deadline') from None
+        finally:
+            self.latencies.append(time.perf_counter() - received)
+        self.service_times.append(time.perf_counter() - started)
+        self.completed += 1
+        return result
+
+    def worker_done(self, future):
+        self.running -= 1
+        self.slots.release()
+        if not future.cancelled():
+            future.exception()  # Retrieved here as well, in case the request was answered at its deadline
+
+    def metrics(self):
+        return {'requests': self.requests, 'completed': self.completed, 'errors': self.errors,
+                'deadline_misses': self.deadline_misses, 'queued': self.queued, 'running': self.running,
+                'workers': self.workers, 'graphs': sorted(self.paths), 'latency': latency_summary(self.latencies),
+                'queue_time': latency_summary(self.queue_times), 'service_time': latency_summary(self.service_times)}
+
+
+async def serve_lines(service, readline, write):
+    """
+    Answers the JSON requests of a line stream, many at a time, each one as soon as it is ready
+    :param readline: Coroutine function which returns the next line, empty at the end of the stream
+    :param write: Function which sends a response
+    """
+    pending = set()
+
+    async def respond(line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            write({'id': None, 'error': repr(e)})
+            return
+        write(await service.respond(request))
+
+    while line := await readline():
+        if line.strip():
+            task = asyncio.create_task(respond(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending)
+
+
+async def serve_stdio(service):
+    """
+    Serves the requests on the standard input until it ends
+    """
+    loop = asyncio.get_running_loop()
+
+    async def readline():
+        # A thread reads the input, which works for pipes, terminals and files alike
+        return await loop.run_in_executor(None, sys.stdin.buffer.readline)
+
+    def write(response):
+        sys.stdout.write(json.dumps(response) + '\n')
+        sys.stdout.flush()
+
+    await serve_lines(service, readline, write)
+
+
+async def serve_unix(service, path):
+    """
+    Serves the requests of every connection to a Unix socket until stopped
+    """
+    async def connection(reader, writer):
+        def write(response):
+            writer.write((json.dumps(response) + '\n').encode())
+
+        try:
+            await serve_lines(service, reader.readline, write)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(connection, path, limit=LINE_LIMIT)
+    async with server:
+        await server.serve_forever()
+
+
+async def main(args):
+    paths = dict(graph.split('=', 1) for graph in args.graph)
+    service = DecisionService(paths, args.workers)
+    await service.start()
+    try:
+        if args.socket:
+            await serve_unix(service, args.socket)
+        else:
+            await serve_stdio(service)
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve agent decisions as JSON lines, on the standard input and '
+                                                 'output or on a Unix socket')
+    parser.add_argument('-g', '--graph', action='append', default=[], metavar='ID=PATH',
+                        help='A graph file to preload under an id, can be given many times')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--socket', help='Path of a Unix socket to listen on instead of the standard input')
+    asyncio.run(main(parser.parse_args()))
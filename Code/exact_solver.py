@@ -0,0 +1,345 @@
+import math
+
+import graph_util
+from agent import Agent
+
+OBJECTIVES = ['adversarial', 'semicoop', 'coop']
+
+
+class SolverBudgetExceeded(Exception):
+    """
+    Raised when the solver has solved as many positions as it may, what it solved before is kept
+    """
+    pass
+
+
+class ExactSolver:
+    """
+    Solves the game exactly by dynamic programming. A position is (time, agent in turn, agent locations, remaining),
+    where remaining is a bitmask of the nodes that had people at the start of the game and can still be emptied. The
+    scores are not part of the position: what the agents collect from a position on does not depend on what they
+    collected before, so the solver memoises the people every agent still collects with optimal play, and a position
+    reached with different scores is solved once. The number of positions still grows exponentially with the number of
+    populated nodes and the deadline: with a deadline of 10, graphs of up to 20 nodes and 8 populated nodes are solved
+    in seconds (the semi-cooperative game, the slowest, solves about 15000 positions a second), 12 populated nodes take
+    minutes and a few more hours. A budget of positions stops the solver on larger instances.
+    Positions are kept small by writing them in a canonical form which does not change their value: people that no agent
+    can reach before the deadline are left out of the mask, an agent that can not reach anyone is terminated, and the
+    origin of an agent is forgotten. Only the positions in which an agent has a choice to make are memoised, the turns
+    of agents on an edge or terminated are played on at once (as are whole rounds, like State.skip_rounds() does).
+    The cooperative and adversarial games are pruned by alpha-beta: a position whose value falls outside the window is
+    not solved exactly, and the bound found for it is memoised instead. The semi-cooperative keys are pairs, which the
+    window can not bound, so that game is solved without pruning and is the slowest of the three.
+    The play is the play of the search agents: each agent in turn picks the successor that is best for its objective,
+    the first one in State.expand() order on ties, where the objectives are
+        'adversarial' - the score difference, agent 0 maximizes it and agent 1 minimizes it
+        'semicoop' - the agent's own score, ties broken by the other agent's score
+        'coop' - the sum of the scores
+    """
+
+    def __init__(self, objective, graph, node_values, deadline, max_positions=None):
+        """
+        :param graph: The CSRGraph of the game
+        :param node_values: Number of people in every node at the start of the game
+        :param deadline: The deadline of the game, it must be positive (without one agents can walk forever)
+        :param max_positions: Most positions to solve over the life of the solver, None for no limit. Solving more
+        raises SolverBudgetExceeded
+        """
+        if objective not in OBJECTIVES:
+            raise ValueError('Objective not recognized')
+        if deadline <= 0:
+            raise ValueError('The exact solver needs a positive deadline')
+        self.objective = objective
+        self.graph = graph
+        self.deadline = deadline
+        self.node_values = tuple(node_values)
+        populated = [node for node in range(len(self.node_values)) if self.node_values[node] > 0]
+        self.bits = [0] * len(self.node_values)  # The bit of every populated node in the mask, 0 for other nodes
+        for i in range(len(populated)):
+            self.bits[populated[i]] = 1 << i
+        # reach[u][k] is the mask of the populated nodes at most k time units away from node u
+        horizon = math.floor(deadline)
+        # distances[i][u] is the distance between the i-th populated node and node u (the graph is undirected)
+        distances = [graph_util.get_distance_row(graph, node).tolist() for node in populated]
+        self.reach = []
+        for u in range(len(self.node_values)):
+            masks = [0] * (horizon + 1)
+            for i in range(len(populated)):
+                if distances[i][u] <= horizon:
+                    masks[int(distances[i][u])] |= 1 << i
+            for k in range(1, horizon + 1):
+                masks[k] |= masks[k - 1]
+            self.reach.append(masks)
+        self.people = {0: 0}  # Mask -> number of people in its nodes
+        self.memo = {}  # Position -> people every agent collects from it on
+        self.bounds = {}  # Position -> (lower, upper) bounds of the key of its value for the agent in turn
+        self.max_positions = max_positions
+        self.positions = 0  # Positions solved, found in neither the memo nor the bounds
+
+    def matches(self, state):
+        """
+        :return: Whether the state is a position of the game being solved, so that it can be looked up in the memo
+        """
+        if state.graph is not self.graph or state.deadline != self.deadline:
+            return False
+        return all(value == 0 or value == self.node_values[node] for node, value in enumerate(state.node_values))
+
+    def position(self, state):
+        remaining = 0
+        for node in range(len(state.node_values)):
+            if state.node_values[node] > 0:
+                remaining |= self.bits[node]
+        return self.canonical(state.current_time, state.agent_turn, state.locations, remaining)
+
+    def canonical(self, time, turn, locations, remaining):
+        """
+        :return: The position in canonical form, which has the same value
+        """
+        time_left = math.floor(self.deadline - time)
+        reachable = 0
+        canonical = []
+        for orig, dest, steps in locations:
+            agent_reach = self.reach[dest][time_left - steps] & remaining if orig != -1 and steps <= time_left else 0
+            if agent_reach:
+                reachable |= agent_reach
+                canonical.append((dest, dest, steps))
+            else:
+                canonical.append((-1, -1, 0))
+        return time, turn, tuple(canonical), remaining & reachable
+
+    def agent_reach(self, time, location):
+        """
+        :return: The mask of the populated nodes an agent at the location can reach before the deadline
+        """
+        orig, dest, steps = location
+        if orig == -1:
+            return 0
+        time_left = math.floor(self.deadline - time) - steps  # The most time left once the agent is at dest
+        return self.reach[dest][time_left] if time_left >= 0 else 0
+
+    def value(self, state):
+        """
+        :return: The scores at the end of the game with optimal play from the state
+        """
+        future = self.solve(*self.position(state))[1]
+        return tuple(state.scores[aid] + future[aid] for aid in range(len(future)))
+
+    def action_values(self, state):
+        """
+        :return: List of (action, scores at the end of the game with optimal play after it) of the agent in turn, one
+        per successor of the state in State.expand() order. The action is the one the agents return from act()
+        """
+        if state.is_state_terminal():
+            return []
+        time, turn, locations, remaining = self.position(state)
+        # The agent in turn may not be able to reach anyone, but it still has all its moves
+        locations = locations[:turn] + (state.locations[turn],) + locations[turn + 1:]
+        values = []
+        for action, gains, child in self.successors(time, turn, locations, remaining):
+            future = self.solve(*child)[1]
+            values.append((action, tuple(state.scores[aid] + gains[aid] + future[aid] for aid in range(len(gains)))))
+        return values
+
+    def key(self, value, aid):
+        """
+        :param value: Scores (or people collected) of every agent
+        :return: How good the value is for agent aid, the higher the better
+        """
+        if self.objective == 'coop':
+            return value[0] + value[1]
+        if self.objective == 'adversarial':
+            return value[aid] - value[1 - aid]
+        return value[aid], value[1 - aid]
+
+    def count_people(self, mask):
+        people = self.people.get(mask)
+        if people is None:
+            people = sum(self.node_values[node] for node in range(len(self.bits)) if self.bits[node] & mask)
+            self.people[mask] = people
+        return people
+
+    def best_key(self, time, turn, locations, remaining):
+        """
+        :return: A key that the agent in turn can not do better than: all the people are collected in the cooperative
+        game, otherwise the agent collects every person it can reach (and the other agent the rest)
+        """
+        people = self.count_people(remaining)
+        if self.objective == 'coop':
+            return people
+        own = self.count_people(self.agent_reach(time, locations[turn]) & remaining)
+        return own if self.objective == 'adversarial' else (own, people - own)
+
+    def solve(self, time, turn, locations, remaining, alpha=-math.inf, beta=math.inf):
+        """
+        :param: A position in canonical form
+        :param alpha: The value is not needed if its key for the agent in turn is not more than alpha
+        :param beta: The value is not needed if its key for the agent in turn is not less than beta
+        The cooperative and adversarial games are searched with alpha-beta pruning, a position whose value is outside
+        the window is not solved exactly and the bound found on its key is memoised instead. The semi-cooperative game
+        is not pruned
+        :return: (the key of the value for the agent in turn, the people every agent collects from the position on with
+        optimal play). The value is None if it is outside the window, the key is then a bound: at most alpha or at
+        least beta
+        """
+        if not remaining or time >= self.deadline:
+            value = (0,) * len(locations)
+            return self.key(value, turn), value
+        position = (time, turn, locations, remaining)
+        best = self.memo.get(position)
+        if best is not None:
+            return self.key(best, turn), best
+        best_possible = self.best_key(time, turn, locations, remaining)
+        if self.objective == 'semicoop':
+            self.count_position()
+            return self.solve_all(position, best_possible)
+        lower, upper = self.bounds.get(position, (-math.inf, best_possible))
+        if upper <= alpha:
+            return upper, None
+        if lower >= beta:
+            return lower, None
+        self.count_position()
+        best_key = None
+        for action, gains, child in self.successors(time, turn, locations, remaining):
+            # Search the successor only for a value which would be better than the best one so far, in the window of the
+            # agent in turn there. The key of the cooperative game is the same for both agents
+            gain = self.key(gains, turn)
+            low = alpha if best_key is None else max(alpha, best_key)
+            if self.objective == 'coop' or child[1] == turn:
+                key, future = self.solve(*child, low - gain, beta - gain)
+                key += gain
+            else:
+                key, future = self.solve(*child, gain - beta, gain - low)
+                key = gain - key
+            if future is None:
+                if key >= beta:
+                    self.bounds[position] = (key, upper)
+                    return key, None
+                continue
+            if best_key is None or key > best_key:
+                best, best_key = tuple(gains[aid] + future[aid] for aid in range(len(gains))), key
+                if key >= beta:
+                    self.bounds[position] = (key, upper)
+                    return key, None
+                if key == best_possible:  # No successor can do better
+                    break
+        if best_key is None or best_key <= alpha:
+            self.bounds[position] = (lower, alpha)
+            return alpha, None
+        self.memo[position] = best
+        return best_key, best
+
+    def count_position(self):
+        self.positions += 1
+        if self.max_positions is not None and self.positions > self.max_positions:
+            raise SolverBudgetExceeded(f'The solver needs more than {self.max_positions} positions')
+
+    def solve_all(self, position, best_possible):
+        """
+        Solves the position exactly, looking at every successor
+        """
+        best, best_key = None, None
+        turn = position[1]
+        for action, gains, child in self.successors(*position):
+            future = self.solve(*child)[1]
+            value = tuple(gains[aid] + future[aid] for aid in range(len(gains)))
+            key = self.key(value, turn)
+            if best_key is None or key > best_key:
+                best, best_key = value, key
+                if key == best_possible:  # No successor can do better
+                    break
+        self.memo[position] = best
+        return best_key, best
+
+    def successors(self, time, turn, locations, remaining):
+        """
+        :return: Generator of (action, people every agent collects on the way, position in canonical form), one per
+        successor in State.expand() order. The position is the next one in which an agent has a choice to make, or the
+        end of the game
+        """
+        orig, dest, steps = locations[turn]
+        if orig == -1 or steps != 0:
+            choices = [locations[turn]]
+        else:
+            choices = [(dest, neighbour, weight) for neighbour, weight in self.graph.adjacency[dest]]
+            choices.append((-1, -1, 0))  # Termination is the last successor
+        for choice in choices:
+            action = ("terminate",) if choice[1] == -1 else ("move", dest, choice[1])
+            gains, child = self.play_on(time, turn, locations[:turn] + (choice,) + locations[turn + 1:], remaining)
+            yield action, gains, child
+
+    def play_on(self, time, turn, locations, remaining):
+        """
+        Plays on after the agent in turn has acted, through the turns of the agents that are on an edge or terminated
+        :return: (people every agent collects, position in canonical form in which an agent has a choice to make, or in
+        which the game ends)
+        """
+        gains = (0,) * len(locations)
+        while True:
+            turn += 1
+            if turn == len(locations):
+                round_gains, (time, turn, locations, remaining) = self.end_rounds(time, locations, remaining)
+                gains = tuple(gains[aid] + round_gains[aid] for aid in range(len(gains)))
+            else:
+                time, turn, locations, remaining = self.canonical(time, turn, locations, remaining)
+            if not remaining or time >= self.deadline:
+                break
+            orig, dest, steps = locations[turn]
+            if orig != -1 and steps == 0:
+                break
+        return gains, (time, turn, locations, remaining)
+
+    def end_rounds(self, time, locations, remaining):
+        """
+        Plays the end of the round, and then the rounds in which every agent is on an edge or terminated
+        :return: (people every agent collects, position in canonical form at the start of the next round in which an
+        agent decides)
+        """
+        gains = [0] * len(locations)
+        rounds = 1
+        while rounds > 0:
+            # As State.end_round()
+            time += rounds
+            locations = tuple((orig, dest, steps - rounds) if steps > 0 else (orig, dest, steps)
+                              for orig, dest, steps in locations)
+            if time <= self.deadline:
+                for aid in range(len(locations)):
+                    orig, dest, steps = locations[aid]
+                    if steps == 0 and dest != -1 and self.bits[dest] & remaining:
+                        gains[aid] += self.node_values[dest]
+                        remaining &= ~self.bits[dest]
+            time, _, locations, remaining = self.canonical(time, 0, locations, remaining)
+            # As State.rounds_to_skip()
+            rounds = 0
+            if remaining and time < self.deadline and all(loc[2] > 0 or loc[1] == -1 for loc in locations):
+                rounds = min(min(loc[2] for loc in locations if loc[2] > 0), math.ceil(self.deadline - time))
+        return tuple(gains), (time, 0, locations, remaining)
+
+
+class ExactAgent(Agent):
+    """
+    An oracle agent which plays optimally for its objective with an ExactSolver. The solver, and everything it solved,
+    is kept for all the decisions of a game
+    """
+
+    def __init__(self, objective):
+        """
+        :param objective: 'adversarial', 'semicoop' or 'coop' (see ExactSolver)
+        """
+        super().__init__()
+        if objective not in OBJECTIVES:
+            raise ValueError('Objective not recognized')
+        self.objective = objective
+        self.solver = None
+
+    def act(self, state):
+        if state.is_agent_moving(self.aid):
+            return ("noop",)
+        if self.solver is None or not self.solver.matches(state):
+            self.solver = ExactSolver(self.objective, state.graph, state.node_values, state.deadline)
+        best, best_key = ("terminate",), None
+        for action, value in self.solver.action_values(state):
+            key = self.solver.key(value, self.aid)
+            if best_key is None or key > best_key:
+                best, best_key = action, key
+        self.num_actions += 1
+        return best
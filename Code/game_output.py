@@ -0,0 +1,128 @@
+import json
+import sys
+
+import graph_util
+
+LEVELS = ['quiet', 'summary', 'step', 'full']
+BUFFER_SIZE = 2 ** 16  # Characters of text kept before writing them out
+SEPARATOR = '-' * 20
+
+
+def format_action(action):
+    if action[0] == 'move':
+        return f'move {action[1]}-{action[2]}'
+    return action[0]
+
+
+class GameOutput:
+    """
+    The output of a game: the simulator reports the start of the game, every round and the end, and the output
+    writes them as text at one of the levels
+        'quiet' - nothing
+        'summary' - the start and the result
+        'step' - and a line per round with what changed: the actions, the people saved and the scores
+        'full' - the whole state after every round in which an agent is at a node (the graph, the people and the
+        agents), which is the classic printout of the simulator
+    and as events (JSON lines, one object with an "event" key per report) to an optional sink. Text is only formatted
+    when the level shows it, and the events only when there is a sink. Both are buffered and written in large batches,
+    call flush() before anyone has to read them in the middle of the game (e.g. a human agent).
+    """
+
+    def __init__(self, level='full', events=None, stream=None):
+        """
+        :param level: Text level, see above
+        :param events: File to write the events to, None for no events
+        :param stream: Stream to write the text to, None for sys.stdout (at the time of writing)
+        """
+        if level not in LEVELS:
+            raise ValueError('Output level not recognized')
+        self.level = LEVELS.index(level)
+        self.stream = stream
+        self.events = open(events, 'w') if events is not None else None
+        self.buffer = []
+        self.buffered = 0
+        self.graph_text = None  # The graph does not change during a game, so its text is formatted once
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= BUFFER_SIZE:
+            self.flush()
+
+    def event(self, name, **fields):
+        self.events.write(json.dumps(dict(event=name, **fields)) + '\n')
+
+    def flush(self):
+        if self.buffer:
+            stream = self.stream if self.stream is not None else sys.stdout
+            stream.write(''.join(self.buffer))
+            stream.flush()
+            self.buffer = []
+            self.buffered = 0
+        if self.events is not None:
+            self.events.flush()
+
+    def close(self):
+        self.flush()
+        if self.events is not None:
+            self.events.close()
+            self.events = None
+
+    def start(self, state, game_type, search):
+        """
+        :param state: The state at the start of the game, after the people at the starting nodes are saved
+        """
+        self.graph_text = None
+        if self.events is not None:
+            self.event('start', game_type=game_type, search=search, num_nodes=state.graph.number_of_nodes(),
+                       num_edges=state.graph.number_of_edges(), deadline=state.deadline, state=state.to_dict())
+        if self.level >= 1:
+            self.write(f'STARTING SIMULATION\n{SEPARATOR}\n')
+        if self.level == 2:
+            self.write(f'{state.people_remaining()} people remaining, deadline {state.deadline}\n'
+                       f'{state.format_agents_locations()}\n')
+        self.dump(state)
+
+    def round(self, state, actions, rounds, scores):
+        """
+        :param state: The state after the round
+        :param actions: The (agent, action) pairs of the round, none if the agents only waited
+        :param rounds: Number of rounds played at once (see State.skip_rounds)
+        :param scores: The scores before the round
+        """
+        if self.events is not None:
+            self.event('round', time=state.current_time, rounds=rounds, actions=[[aid, list(action)]
+                                                                                 for aid, action in actions],
+                       locations=[list(loc) for loc in state.locations], scores=list(state.scores),
+                       people_remaining=state.people_remaining())
+        if self.level == 2:
+            moves = [f'agent {aid} {format_action(action)}' for aid, action in actions if action[0] != 'noop']
+            parts = [', '.join(moves) if moves else f'waited {rounds} rounds' if rounds > 1 else 'waited']
+            for aid in range(len(scores)):
+                if state.scores[aid] > scores[aid]:
+                    parts.append(f'agent {aid} saved {state.scores[aid] - scores[aid]}')
+            self.write(f'Time-step {state.current_time}: {"; ".join(parts)}; '
+                       f'People saved vector: {list(state.scores)}\n')
+        if not state.are_all_agents_moving_or_terminated():
+            self.dump(state)
+
+    def dump(self, state):
+        if self.level == 3:
+            if self.graph_text is None:
+                self.graph_text = graph_util.format_graph(state.graph)
+            self.write(f'{SEPARATOR}\n{state.format(self.graph_text)}\n')
+
+    def end(self, state, rounds, agent_times, search_stats):
+        """
+        Reports the result and writes out everything
+        :param search_stats: The search statistics of the agents (see Simulator.search_stats)
+        """
+        if self.events is not None:
+            self.event('end', scores=list(state.scores), rounds=rounds, final_time=state.current_time,
+                       agent_times=agent_times, search_stats=search_stats)
+        if self.level in [1, 2]:
+            self.write(f'Game over at time-step {state.current_time} after {rounds} rounds\n'
+                       f'People saved vector: {list(state.scores)}\n')
+        if self.level >= 1:
+            self.write(f'{SEPARATOR}\nEND OF RUN\n')
+        self.flush()
@@ -0,0 +1,50 @@
+import json
+
+
+class GameRecorder:
+    """
+    Writes the record of a game, one JSON value per line:
+        the game - an object with the hash of the graph (see CSRGraph.digest), the deadline, the game type, the search,
+        the search arguments (arguments which are not JSON types, like a move ordering, are written as their repr and
+        have to be given again to replay the game), the starting vertices and the State options
+        every act() call - an array [agent, time, action, seconds, nodes], where time is the time of the state the agent
+        acted in, seconds is the time act() took and nodes is the number of nodes the agent searched (null if it does
+        not count them)
+        the result - an object with the scores, the number of rounds and the final time, missing if the game did not end
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def start(self, graph, deadline, game_type, search, search_args, starts, state_options):
+        self.write({'graph_hash': graph.digest(), 'deadline': deadline, 'game_type': game_type, 'search': search,
+                    'search_args': search_args, 'starts': list(starts), 'state_options': state_options})
+
+    def act(self, aid, current_time, action, seconds, nodes):
+        self.write([aid, current_time, list(action), seconds, nodes])
+
+    def end(self, state, rounds):
+        self.write({'scores': list(state.scores), 'rounds': rounds, 'final_time': state.current_time})
+        self.close()
+
+    def write(self, value):
+        self.file.write(json.dumps(value, default=repr, separators=(',', ':')) + '\n')
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_record(path):
+    """
+    :return: (the game, the list of the act() calls, the result or None), see GameRecorder
+    """
+    with open(path) as f:
+        values = [json.loads(line) for line in f if line.strip()]
+    if not values or not isinstance(values[0], dict):
+        raise ValueError(f'{path} is not a game record')
+    game, acts = values[0], values[1:]
+    result = None
+    if acts and isinstance(acts[-1], dict):
+        result = acts.pop()
+    return game, acts, result
@@ -1,14 +1,25 @@
 import random
+import sys
+
+CHUNK_LINES = 10000  # Number of lines written to the file at once
 
 
 class GraphGenerator:
-    def __init__(self):
+    def __init__(self, seed=None):
+        """
+        :param seed: Seed of the random generator, the same seed generates the same graphs
+        """
+        self.random = random.Random(seed)
         self.node_values_sample_list = [0] * 10
         self.node_values_sample_list.extend(i for i in range(1, 11))
         self.edge_values_sample_list = [1] * 5
         self.edge_values_sample_list.extend(i for i in range(2, 6))
 
     def generate_graph(self, file_path, num_nodes, num_edges, deadline=1):
+        """
+        Writes a random connected graph. Time and memory are linear in the number of edges, except for graphs with more
+        than half of all possible edges, for which every node pair is looked at once.
+        """
         if num_edges > num_nodes * (num_nodes - 1) / 2:
             raise ValueError('Too many edges')
         if num_edges < num_nodes - 1:
@@ -16,37 +27,79 @@ class GraphGenerator:
         with open(file_path, 'w+') as f:
             f.write(f'#N {num_nodes}\n')
             f.write(f'#D {deadline}\n')
-            for i in range(num_nodes):
-                node_value = random.choice(self.node_values_sample_list)
-                f.write(f'#V{i}')
-                if node_value:
-                    f.write(f' P{node_value}')
-                f.write('\n')
+            for start in range(0, num_nodes, CHUNK_LINES):
+                count = min(CHUNK_LINES, num_nodes - start)
+                values = self.random.choices(self.node_values_sample_list, k=count)
+                f.write(''.join(f'#V{start + i} P{values[i]}\n' if values[i] else f'#V{start + i}\n'
+                                for i in range(count)))
             f.write('\n')
             # The graph must be connected and therefore we create a path between all nodes in random order
-            # If there are more edges to count for, they will be sampled from a list containing all pairs instead of
-            # randomly picking two nodes to prevent long calculation time (it needs to reroll if edge already existS)
-            path_nodes = [i for i in range(num_nodes)]
-            random.shuffle(path_nodes)
-            edge_count = 0
-            possible_edges = self.generate_all_node_pairs(num_nodes)
-            for i in range(num_nodes - 1):
-                edge = (min(path_nodes[i], path_nodes[i + 1]), max(path_nodes[i], path_nodes[i + 1]))
-                f.write(f'#E{edge_count} {edge[0]} {edge[1]} W{random.choice(self.edge_values_sample_list)}\n')
-                edge_count += 1
-                possible_edges.remove(edge)
-            for i in range(num_edges - num_nodes + 1):
-                edge = random.choice(possible_edges)
-                f.write(f'#E{edge_count} {edge[0]} {edge[1]} W{random.choice(self.edge_values_sample_list)}\n')
-                edge_count += 1
-                possible_edges.remove(edge)
+            path_nodes = list(range(num_nodes))
+            self.random.shuffle(path_nodes)
+            edges = ((path_nodes[i], path_nodes[i + 1]) for i in range(num_nodes - 1))
+            used = {self.pair_key(u, v, num_nodes) for u, v in zip(path_nodes, path_nodes[1:])}
+            extra = num_edges - num_nodes + 1
+            free = num_nodes * (num_nodes - 1) // 2 - len(used)
+            edge_count = self.write_edges(f, edges, 0)
+            if extra <= free // 2:
+                # A random pair is new with probability at least 1/2, so rerolling the used ones is cheap
+                edges = self.sample_new_pairs(num_nodes, extra, used)
+            else:
+                # Most pairs are edges, so sample the pairs that are not and write all the rest
+                excluded = set(used)
+                for _ in self.sample_new_pairs(num_nodes, free - extra, excluded):
+                    pass
+                edges = (pair for pair in self.generate_all_node_pairs(num_nodes)
+                         if self.pair_key(pair[0], pair[1], num_nodes) not in excluded)
+            self.write_edges(f, edges, edge_count)
+
+    def sample_new_pairs(self, num_nodes, count, used):
+        """
+        :param used: Keys (see pair_key) of the pairs not to sample, the sampled pairs are added to it
+        :return: Generator of count random node pairs which are not in used and are all different
+        """
+        randrange = self.random.randrange
+        while count > 0:
+            u = randrange(num_nodes)
+            v = randrange(num_nodes - 1)
+            if v >= u:
+                v += 1
+            key = self.pair_key(u, v, num_nodes)
+            if key not in used:
+                used.add(key)
+                count -= 1
+                yield u, v
+
+    def write_edges(self, f, edges, edge_count):
+        """
+        :param edges: Iterable of node pairs, each gets a random weight
+        :param edge_count: Id of the first edge
+        :return: Id of the next edge
+        """
+        chunk = []
+        for u, v in edges:
+            chunk.append((min(u, v), max(u, v)))
+            if len(chunk) == CHUNK_LINES:
+                edge_count = self.write_edge_chunk(f, chunk, edge_count)
+                chunk = []
+        return self.write_edge_chunk(f, chunk, edge_count)
+
+    def write_edge_chunk(self, f, chunk, edge_count):
+        weights = self.random.choices(self.edge_values_sample_list, k=len(chunk))
+        f.write(''.join(f'#E{edge_count + i} {chunk[i][0]} {chunk[i][1]} W{weights[i]}\n' for i in range(len(chunk))))
+        return edge_count + len(chunk)
+
+    @staticmethod
+    def pair_key(u, v, num_nodes):
+        return min(u, v) * num_nodes + max(u, v)
 
     def generate_all_node_pairs(self, num_nodes):
-        pairs = []
         for i in range(num_nodes):
-            pairs.extend((i, j) for j in range(i + 1, num_nodes))
-        return pairs
+            for j in range(i + 1, num_nodes):
+                yield i, j
 
 
 if __name__ == '__main__':
-    GraphGenerator().generate_graph(r"C:\Users\Lior\Desktop\f.txt", 10, 25)
+    # Usage: python graph_generator.py <file path> <number of nodes> <number of edges> [deadline] [seed]
+    GraphGenerator(int(sys.argv[5]) if len(sys.argv) > 5 else None).generate_graph(
+        sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), float(sys.argv[4]) if len(sys.argv) > 4 else 1)
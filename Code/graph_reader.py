@@ -1,8 +1,50 @@
+import os
+import struct
+
 import networkx as nx
+import numpy as np
+
+from csr_graph import CSRGraph
+
+# Binary graph file: a header followed by int64 arrays, written next to the text file (see write_binary)
+BINARY_SUFFIX = '.csr'
+BINARY_MAGIC = b'IAICSR1\0'
+BINARY_HEADER = struct.Struct('<8sqqqqd')  # magic, text size, text mtime (ns), nodes, edges, deadline
 
 
 class GraphReader:
-    def read(self, path):
+    def read(self, path, verbose=True, cache=True, csr=False):
+        """
+        :param path: Path of the graph text file
+        :param cache: Load the graph from the binary file next to the text file, and write that file if it is missing
+        or older than the text file
+        :param csr: Return a CSRGraph (the graph of the game) instead of a networkx graph (the graph to edit or draw).
+        From the binary file it is built on the mapped arrays, without a networkx graph
+        :return: (graph, deadline)
+        """
+        if cache:
+            stat = os.stat(path)
+            loaded = read_binary(path + BINARY_SUFFIX, stat, csr)
+            if loaded is None:
+                graph, deadline = self.read_text(path)
+                try:
+                    write_binary(graph, deadline, path + BINARY_SUFFIX, stat)
+                except OSError:  # E.g. a read-only directory, the text is read again next time
+                    pass
+                else:
+                    if csr:  # The arrays of the file just written are shared with every other process that maps it
+                        graph = read_binary(path + BINARY_SUFFIX, stat, csr)[0]
+            else:
+                graph, deadline = loaded
+        else:
+            graph, deadline = self.read_text(path)
+        if csr:
+            graph = CSRGraph.from_graph(graph)
+        if verbose:
+            print(graph)
+        return graph, deadline
+
+    def read_text(self, path):
         with open(path, 'r') as f:
             next(f)
             deadline = float(self.formatline(f.readline())[1])
@@ -25,7 +67,6 @@ class GraphReader:
                         graph.add_edge(vertex1id, vertex2id, eid=edgeid, weight=weight)
                 else:
                     reading_vertices = False
-        print(graph)
         return graph, deadline
 
     def formatline(self, line: str):
@@ -33,3 +74,125 @@ class GraphReader:
             return line[1:].split(';')[0].strip().split()  # Remove the comment if there is one and split into the parts
         else:  # The empty line that marks the switch from vertices to edges
             return ''
+
+
+def write_binary(graph, deadline, path, source_stat):
+    """
+    Layout, all arrays are little-endian int64 and n, m are the numbers of nodes and edges:
+        node ids (n), node values (n) - in the order networkx iterates the nodes
+        edge first nodes, second nodes, weights, ids (m each) - in an order that adding them to a graph gives every node
+        its neighbours in the same order as this graph (see insertion_order)
+        CSR index pointers (n + 1), neighbour positions, weights, edge ids (2m each) - the neighbours of the i-th node
+        are at [pointers[i], pointers[i + 1]) in the order networkx iterates them
+    The file is written to a temporary name first, so parallel readers never see half a file
+    :param source_stat: os.stat() of the text file, a later change to it makes the binary file stale
+    """
+    nodes = list(graph.nodes)
+    position = {node: i for i, node in enumerate(nodes)}
+    pointers = [0]
+    neighbours, weights, eids = [], [], []
+    for node, adjacent in graph.adjacency():
+        for neighbour, data in adjacent.items():
+            neighbours.append(position[neighbour])
+            weights.append(data['weight'])
+            eids.append(data['eid'])
+        pointers.append(len(neighbours))
+    order = insertion_order(pointers, neighbours)
+    arrays = [nodes, [graph.nodes[node]['value'] for node in nodes],
+              [nodes[u] for u, i in order], [nodes[neighbours[i]] for u, i in order],
+              [weights[i] for u, i in order], [eids[i] for u, i in order],
+              pointers, neighbours, weights, eids]
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, source_stat.st_size, source_stat.st_mtime_ns, len(nodes), len(order),
+                                   deadline))
+        for array in arrays:
+            f.write(np.asarray(array, dtype='<i8').tobytes())
+    os.replace(temp_path, path)
+
+
+def insertion_order(pointers, neighbours):
+    """
+    A graph lists the neighbours of a node in the order their edges were added. This finds an order of the edges that
+    gives every node its neighbours in CSR order: an edge can be added once it is the next one in the lists of both its
+    nodes. The order the graph was built in is one such order, so there always is one.
+    :return: List of (node position, index of the edge in the CSR of that node), one per edge
+    """
+    head = pointers[:-1]  # Index of the next edge to add in the CSR of each node
+
+    def ready(u):
+        if head[u] == pointers[u + 1]:
+            return False
+        v = neighbours[head[u]]
+        return head[v] < pointers[v + 1] and neighbours[head[v]] == u
+
+    order = []
+    stack = [u for u in range(len(head)) if ready(u)]
+    while stack:
+        u = stack.pop()
+        if not ready(u):  # Already added from its other node
+            continue
+        v = neighbours[head[u]]
+        order.append((u, head[u]))
+        head[u] += 1
+        if v != u:
+            head[v] += 1
+            if ready(v):
+                stack.append(v)
+        if ready(u):
+            stack.append(u)
+    return order
+
+
+def map_binary(path, source_stat=None):
+    """
+    Maps the arrays of a binary graph file (see write_binary) into memory, processes that map the same file share its
+    pages
+    :param source_stat: os.stat() of the text file, None to skip the staleness check
+    :return: (deadline, dictionary of array name to read-only array), or None if the file is missing or stale
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(BINARY_HEADER.size)
+    except OSError:
+        return None
+    if len(header) < BINARY_HEADER.size:
+        return None
+    magic, size, mtime, num_nodes, num_edges, deadline = BINARY_HEADER.unpack(header)
+    if magic != BINARY_MAGIC or (source_stat is not None and (size, mtime) != (source_stat.st_size,
+                                                                                source_stat.st_mtime_ns)):
+        return None
+    arrays = {}
+    offset = BINARY_HEADER.size
+    for name, length in [('node_ids', num_nodes), ('node_values', num_nodes), ('edge_u', num_edges),
+                         ('edge_v', num_edges), ('edge_weights', num_edges), ('edge_ids', num_edges),
+                         ('pointers', num_nodes + 1), ('neighbours', 2 * num_edges), ('weights', 2 * num_edges),
+                         ('eids', 2 * num_edges)]:
+        arrays[name] = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(length,)) if length else \
+            np.zeros(0, dtype='<i8')
+        offset += 8 * length
+    return deadline, arrays
+
+
+def read_binary(path, source_stat=None, csr=False):
+    """
+    :param csr: Build a CSRGraph on the mapped arrays instead of a networkx graph, if its nodes are numbered 0 to n-1
+    :return: (graph, deadline) built from a binary graph file, the same graph the text file gives, or None if the file
+    is missing or stale
+    """
+    mapped = map_binary(path, source_stat)
+    if mapped is None:
+        return None
+    deadline, arrays = mapped
+    if csr and np.array_equal(arrays['node_ids'], np.arange(len(arrays['node_ids']))):
+        return CSRGraph(arrays['pointers'], arrays['neighbours'], arrays['weights'], arrays['eids'],
+                        arrays['node_values'].tolist()), deadline
+    graph = nx.Graph()
+    # Added in the order of the text file, so the graph iterates nodes and neighbours in the same order
+    graph.add_nodes_from(zip(arrays['node_ids'].tolist(),
+                             ({'value': value} for value in arrays['node_values'].tolist())))
+    graph.add_edges_from(zip(arrays['edge_u'].tolist(), arrays['edge_v'].tolist(),
+                             ({'eid': eid, 'weight': weight} for eid, weight in zip(arrays['edge_ids'].tolist(),
+                                                                                   arrays['edge_weights'].tolist()))))
+    graph.graph['csr'] = arrays
+    return graph, deadline
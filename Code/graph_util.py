@@ -1,66 +1,179 @@
+import heapq
 import math
 
 import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
 from networkx.drawing.nx_pydot import graphviz_layout
 
+# Unless noted otherwise, the graph is a CSRGraph (State.graph). The networkx graph from GraphReader is only used to
+# edit and draw the graph
+
+# Largest graph whose all-pairs shortest paths are computed (two n*n matrices, Floyd-Warshall takes O(n^3) time). The
+# distances in larger graphs are found by Dijkstra from the nodes that are asked about
+DENSE_PATHS_LIMIT = 500
+DISTANCE_ROWS_CACHED = 256  # Dijkstra distance rows kept per graph
+
 
 def total_node_value(graph):
     """
     :param graph: the graph
     :return: number of people remaining to be saved
     """
-    return sum(node[1]['value'] for node in graph.nodes.data())
+    return sum(graph.node_values)
 
 
 def set_node_value(graph, node, value):
+    """
+    :param graph: A networkx graph
+    """
     graph.nodes[node]['value'] = value
+    # The arrays it was loaded from are no longer correct
+    graph.graph.pop('csr', None)
 
 
 def graph_to_node_value_list(graph):
-    value_list = [0] * graph.number_of_nodes()
-    for i in graph.nodes:
-        value_list[i] = graph.nodes[i]['value']
-    return value_list
+    return list(graph.node_values)
 
 
 def get_node_value(graph, node):
-    return graph.nodes[node]['value']
+    return graph.node_values[node]
 
 
 def gas_node_value(graph, node, value):
+    """
+    :param graph: A networkx graph
+    """
     # Get and set
     prev_value = graph.nodes[node]['value']
     graph.nodes[node]['value'] = value
+    graph.graph.pop('csr', None)  # The arrays it was loaded from are no longer correct
     return prev_value
 
 
 def remove_edge(graph, nid1, nid2):
+    """
+    :param graph: A networkx graph
+    """
     graph.remove_edge(nid1, nid2)
+    # The arrays it was loaded from are no longer correct
+    graph.graph.pop('csr', None)
 
 
 def get_edge_weight(graph, nid1, nid2):
-    return graph[nid1][nid2]['weight']
+    return graph.get_edge_weight(nid1, nid2)
 
 
 def get_neighbours(graph, node):
-    return [n for n in graph.neighbors(node)]
+    return graph.get_neighbours(node)
+
+
+def get_shortest_paths(graph):
+    """
+    :param graph: The graph
+    :return: (distances, next hops), n*n arrays where distances[u, v] is the length of the shortest path from u to v
+    (inf if there is none) and next hops[u, v] is the node after u on that path (-1 if there is none).
+    The graph does not change, so this is computed once (Floyd-Warshall) and cached in the graph. Only for graphs of up
+    to DENSE_PATHS_LIMIT nodes, see get_distance_row for any graph
+    """
+    paths = graph.shortest_paths
+    if paths is None:
+        n = graph.number_of_nodes()
+        if n > DENSE_PATHS_LIMIT:
+            raise ValueError(f'All-pairs shortest paths of {n} nodes need too much memory')
+        distances = np.full((n, n), np.inf)
+        next_hops = np.full((n, n), -1, dtype=np.int64)
+        sources = np.repeat(np.arange(n), np.diff(graph.pointers))
+        distances[sources, graph.neighbours] = graph.weights
+        next_hops[sources, graph.neighbours] = graph.neighbours
+        np.fill_diagonal(distances, 0)
+        np.fill_diagonal(next_hops, np.arange(n))
+        for k in range(n):
+            through_k = distances[:, k, None] + distances[None, k, :]
+            shorter = through_k < distances
+            distances = np.where(shorter, through_k, distances)
+            next_hops = np.where(shorter, next_hops[:, k, None], next_hops)
+        paths = graph.shortest_paths = (distances, next_hops)
+    return paths
+
+
+def get_distances(graph):
+    return get_shortest_paths(graph)[0]
+
+
+def is_dense(graph):
+    """
+    :return: Whether the distances of the graph come from the all-pairs matrices (see get_shortest_paths)
+    """
+    return graph.number_of_nodes() <= DENSE_PATHS_LIMIT
+
+
+def dijkstra(graph, sources):
+    """
+    :param sources: The nodes to start from
+    :return: (distances, predecessors), lists of the length of the shortest path from the closest source to every
+    node (inf if there is none) and the node before it on that path (-1 for the sources and unreachable nodes)
+    """
+    distances = [math.inf] * graph.number_of_nodes()
+    predecessors = [-1] * graph.number_of_nodes()
+    heap = []
+    for source in sources:
+        distances[source] = 0
+        heap.append((0, source))
+    heapq.heapify(heap)
+    adjacency = graph.adjacency
+    while heap:
+        distance, u = heapq.heappop(heap)
+        if distance > distances[u]:
+            continue
+        for v, weight in adjacency[u]:
+            if distance + weight < distances[v]:
+                distances[v] = distance + weight
+                predecessors[v] = u
+                heapq.heappush(heap, (distance + weight, v))
+    return distances, predecessors
+
+
+def get_distance_row(graph, source):
+    """
+    :return: Array of the length of the shortest path from the source to every node (inf if there is none), a row of
+    the all-pairs matrix in small graphs. In large graphs it is found by Dijkstra and the last DISTANCE_ROWS_CACHED
+    rows are cached in the graph
+    """
+    if is_dense(graph):
+        return get_distances(graph)[source]
+    rows = graph.distance_rows
+    row = rows.get(source)
+    if row is None:
+        if len(rows) >= DISTANCE_ROWS_CACHED:  # Drop the oldest
+            del rows[next(iter(rows))]
+        row = rows[source] = np.asarray(dijkstra(graph, [source])[0], dtype=float)
+    return row
+
+
+def get_values(graph, node_values=None):
+    """
+    :return: The node values as an array, taken from the graph if they are not given
+    """
+    return np.asarray(node_values if node_values is not None else graph.node_values)
 
 
-def get_num_positive_nodes(graph):
+def get_num_positive_nodes(graph, node_values=None):
     """
     :param graph: The graph
+    :param node_values: Number of people in every node, taken from the graph if not given
     :return: The number of nodes with people in them
     """
-    return len([n for n in graph.nodes(data=True) if n[1]['value'] > 0])
+    return int(np.count_nonzero(get_values(graph, node_values) > 0))
 
 
-def get_num_positive_nodes_excluding_current(graph, currnode):
+def get_num_positive_nodes_excluding_current(graph, currnode, node_values=None):
     """
     :param graph: The graph
     :return: The number of nodes with people in them excluding current
     """
-    return get_num_positive_nodes(graph) - (graph.nodes[currnode]['value'] > 0)
+    values = get_values(graph, node_values)
+    return int(np.count_nonzero(values > 0)) - int(values[currnode] > 0)
 
 
 def get_minimum_edge_neighbour(graph, node):
@@ -69,66 +182,112 @@ def get_minimum_edge_neighbour(graph, node):
     :param node: Current node to search from
     :return: The neighbouring node with the minimal weight from the current node
     """
-    neighbors_edges_dict = graph[node]
-    if len(neighbors_edges_dict) == 0:
+    start, end = int(graph.pointers[node]), int(graph.pointers[node + 1])
+    if start == end:
         return -1
-    mindest = None
-    minweight = math.inf
-    for dest in neighbors_edges_dict:
-        weight = neighbors_edges_dict[dest]["weight"]
-        if mindest is None:
-            mindest = dest
-            minweight = weight
-        else:
-            if weight < minweight:
-                mindest = dest
-                minweight = weight
-            elif weight == minweight:
-                # Prefer lower numbered nodes
-                if neighbors_edges_dict[dest]["eid"] < neighbors_edges_dict[mindest]["eid"]:
-                    mindest = dest
-                    minweight = weight
-    return mindest
-
-
-def get_min_path_value_to_people(graph, currnode):
-    if get_num_positive_nodes(graph) == 0:  # If goal return 0
+    # Prefer lower numbered edges on ties
+    best = min(range(start, end), key=lambda i: (graph.weights[i], graph.eids[i]))
+    return int(graph.neighbours[best])
+
+
+def get_min_path_value_to_people(graph, currnode, node_values=None):
+    values = get_values(graph, node_values)
+    people_nodes = values > 0
+    if not people_nodes.any():  # If goal return 0
         return 0
     # If the node has people, return 0 (as the path to people is to stay in the node)
-    if graph.nodes[currnode]['value'] > 0:
+    if people_nodes[currnode]:
         return 0
-    paths_value = nx.algorithms.shortest_paths.weighted.single_source_dijkstra(graph, currnode)[0]
-    min_value = math.inf
-    for n in paths_value:
-        if n != currnode and graph.nodes[n]['value'] > 0:
-            if paths_value[n] < min_value:
-                min_value = paths_value[n]
-    return min_value
+    return get_distance_row(graph, currnode)[people_nodes].min().item()
+
+
+def get_distances_to_people(graph, node_values):
+    """
+    :param graph: The graph
+    :param node_values: Number of people in every node
+    :return: List of the distance from every node to the closest node with people in it (inf if there is none)
+    The result for the last node values tuple is cached in the graph, states share their node values tuple with all
+    their successors that do not collect people, so this is mostly a lookup during a search
+    """
+    cached = graph.people_distances
+    if cached is not None and cached[0] is node_values:
+        return cached[1]
+    people_nodes = get_values(graph, node_values) > 0
+    if not people_nodes.any():
+        distances = [math.inf] * len(node_values)
+    elif is_dense(graph):
+        distances = get_distances(graph)[:, people_nodes].min(axis=1).tolist()
+    else:  # The graph is undirected, so the distance to the closest people is the distance from them
+        distances = [float(distance) for distance in dijkstra(graph, np.flatnonzero(people_nodes).tolist())[0]]
+    if isinstance(node_values, tuple):  # Only immutable values can be cached by identity
+        graph.people_distances = (node_values, distances)
+    return distances
+
+
+def get_reachable_people_value(graph, node_values, locations, time_left=math.inf):
+    """
+    :param graph: The graph
+    :param node_values: Number of people in every node
+    :param locations: Locations (origin, destination, steps left) of the agents, terminated agents are ignored
+    :param time_left: Time units left until the deadline
+    :return: The number of people in nodes that at least one agent can reach in time
+    """
+    reachable = np.zeros(len(node_values), dtype=bool)
+    for orig, dest, steps in locations:
+        if dest != -1 and steps <= time_left:
+            reachable |= get_distance_row(graph, dest) <= time_left - steps
+    return int(get_values(graph, node_values)[reachable].sum())
 
 
 def print_graph(graph):
-    for n in range(graph.number_of_nodes()):
-        print(f'{n}v{graph.nodes[n]["value"]}= ', end="")
-        print(', '.join(
-            f'{neighbour}:e{graph[n][neighbour]["eid"]}w{graph[n][neighbour]["weight"]}' for neighbour in graph[n]))
+    if graph.number_of_nodes() > 0:
+        print(format_graph(graph))
+
+
+def format_graph(graph):
+    """
+    :return: The text of print_graph, a line per node with its people and its edges
+    """
+    neighbours, eids, weights = graph.neighbours.tolist(), graph.eids.tolist(), graph.weights.tolist()
+    pointers = graph.pointers.tolist()
+    return '\n'.join(f'{n}v{graph.node_values[n]}= ' +
+                     ', '.join(f'{neighbours[i]}:e{eids[i]}w{weights[i]}' for i in range(pointers[n], pointers[n + 1]))
+                     for n in range(graph.number_of_nodes()))
 
 
-def get_min_path_to_people(graph, currnode):
-    if get_num_positive_nodes_excluding_current(graph, currnode) == 0:
+def get_min_path_to_people(graph, currnode, node_values=None):
+    """
+    :return: The nodes on a shortest path from the current node to the closest other node with people in it (the lowest
+    numbered one on ties), without the current node
+    """
+    values = get_values(graph, node_values)
+    people_nodes = values > 0
+    people_nodes[currnode] = False
+    if not people_nodes.any():
+        return []
+    if is_dense(graph):
+        distances, next_hops = get_shortest_paths(graph)
+        distances = distances[currnode]
+    else:
+        distances, predecessors = dijkstra(graph, [currnode])
+    # Nodes that can not be reached have an infinite distance, so they are never the closest one
+    target_distances = np.where(people_nodes, distances, np.inf)
+    target = int(np.argmin(target_distances))
+    if target_distances[target] == np.inf:
         return []
-    paths_values, paths = nx.algorithms.shortest_paths.weighted.single_source_dijkstra(graph, currnode)
-    min_path_value = math.inf
-    min_path = []
-    for i in range(graph.number_of_nodes()):
-        if i != currnode and graph.nodes[i]['value'] > 0:
-            if paths_values[i] < min_path_value:
-                min_path_value = paths_values[i]
-                min_path = paths[i]
-            elif paths_values[i] == min_path_value:
-                if i < min_path[-1]:
-                    min_path_value = paths_values[i]
-                    min_path = paths[i]
-    return min_path[1:]
+    path = []
+    if is_dense(graph):
+        node = currnode
+        while node != target:
+            node = int(next_hops[node, target])
+            path.append(node)
+    else:
+        node = target
+        while node != currnode:
+            path.append(node)
+            node = predecessors[node]
+        path.reverse()
+    return path
 
 
 def draw_graph(self, tree):
@@ -0,0 +1,156 @@
+import math
+import random
+import time
+
+from agent import Agent
+from state import TERMINATE, WAIT
+
+MAX_PLIES = 400  # Most plies simulated from the root when the game has no deadline and no depth is given
+OBJECTIVES = ['adversarial', 'semicoop', 'coop']
+
+
+class Node:
+    """
+    A node of the search tree. The actions of its state are listed when the node is first reached, and their successors
+    are created and added to the tree one by one, in random order
+    """
+    __slots__ = ('state', 'parent', 'index', 'ply', 'children', 'untried', 'visits', 'rewards')
+
+    def __init__(self, state, parent=None, index=0):
+        """
+        :param index: Index of the state's action in the State.legal_actions() of its parent's state
+        """
+        self.state = state
+        self.parent = parent
+        self.index = index
+        self.ply = parent.ply + 1 if parent is not None else 0
+        self.children = []
+        self.untried = None  # Actions whose successors are not in the tree yet as (index, action), None until expanded
+        self.visits = 0
+        self.rewards = None  # Sum of the rewards of every agent over the visits
+
+
+class MCTSAgent(Agent):
+    """
+    Monte Carlo tree search with UCT. Every iteration walks down the tree choosing children by UCT for the agent in
+    turn, adds one new child, plays the game on from it with random moves and adds the reward of every agent along the
+    path.
+    Each agent maximizes its own reward, which comes from the scores at the end of the playout:
+        'adversarial' - the score difference, the other agent gets the opposite
+        'semicoop' - the agent's own score, ties broken by the other agent's score
+        'coop' - the sum of the scores, the same for both agents
+    An iteration creates at most one successor state and plays a playout of bounded length, so the time per decision is
+    set by the budget and not by the size of the graph.
+    """
+
+    def __init__(self, objective, iterations=1000, time_budget=None, depth=None, exploration=math.sqrt(2), seed=None):
+        """
+        :param objective: 'adversarial', 'semicoop' or 'coop'
+        :param iterations: Number of iterations per decision, None for no limit (then a time budget is needed)
+        :param time_budget: Seconds of wall-clock time per decision, None for no limit
+        :param depth: Most plies simulated from the root (tree and playout), None to play until the game ends
+        :param exploration: The UCT exploration constant
+        :param seed: Seed of the random playouts
+        """
+        super().__init__()
+        if objective not in OBJECTIVES:
+            raise ValueError('Objective not recognized')
+        if iterations is None and time_budget is None:
+            raise ValueError('MCTS needs an iteration or a time budget')
+        self.objective = objective
+        self.iterations = iterations
+        self.time_budget = time_budget
+        self.depth = depth
+        self.exploration = exploration
+        self.random = random.Random(seed)
+        self.nodes = 0  # Iterations of the last decision
+        self.root = None  # Search tree of the last decision
+        self.total_people = 0
+
+    def act(self, state):
+        self.nodes = 0  # Also for a noop, which searches nothing
+        if state.is_agent_moving(self.aid):
+            return ("noop",)
+        # Rewards are normalized by the number of people in the game, collected or not
+        self.total_people = max(sum(state.scores) + state.people_remaining(), 1)
+        self.root = Node(state.copy())
+        self.nodes = 0
+        deadline = time.perf_counter() + self.time_budget if self.time_budget is not None else math.inf
+        while (self.iterations is None or self.nodes < self.iterations) and time.perf_counter() < deadline:
+            self.iterate(self.root)
+            self.nodes += 1
+        best = None
+        for child in self.root.children:  # The most visited child, ties go to the first in State.expand()
+            if best is None or (child.visits, -child.index) > (best.visits, -best.index):
+                best = child
+        self.num_actions += 1
+        return self.get_action(state, best.state if best is not None else None)
+
+    def iterate(self, root):
+        node = root
+        # Selection
+        while True:
+            if node.untried is None:
+                node.untried = list(enumerate(node.state.legal_actions()))
+            if node.untried or not node.children:
+                break
+            node = self.select_child(node)
+        # Expansion
+        if node.untried:
+            index, action = node.untried.pop(self.random.randrange(len(node.untried)))
+            child = Node(node.state.result(action), node, index)
+            node.children.append(child)
+            node = child
+        # Simulation
+        max_plies = self.depth if self.depth is not None else MAX_PLIES
+        rewards = self.rewards(self.playout(node.state, max_plies - node.ply))
+        # Backpropagation
+        while node is not None:
+            node.visits += 1
+            if node.rewards is None:
+                node.rewards = list(rewards)
+            else:
+                for aid in range(len(rewards)):
+                    node.rewards[aid] += rewards[aid]
+            node = node.parent
+
+    def select_child(self, node):
+        aid = node.state.agent_turn
+        log_visits = math.log(node.visits)
+        best, best_value = None, -math.inf
+        for child in node.children:
+            value = child.rewards[aid] / child.visits + self.exploration * math.sqrt(log_visits / child.visits)
+            if value > best_value:
+                best, best_value = child, value
+        return best
+
+    def playout(self, state, plies):
+        """
+        Plays on from the state with random moves (an agent only terminates when it has nowhere to go)
+        :param plies: Most plies to play
+        :return: The final state
+        """
+        state = state.copy()
+        while plies > 0 and not state.is_state_terminal():
+            aid = state.agent_turn
+            action = WAIT
+            if not (state.is_agent_terminated(aid) or state.is_agent_moving(aid)):
+                moves = state.graph.moves[state.locations[aid][1]]
+                action = moves[self.random.randrange(len(moves))] if moves else TERMINATE
+            state.apply(action)
+            plies -= 1
+        return state
+
+    def rewards(self, state):
+        """
+        :return: The reward of every agent in [0, 1]
+        """
+        s0, s1 = state.scores
+        total = self.total_people
+        if self.objective == 'adversarial':
+            r0 = (s0 - s1 + total) / (2 * total)
+            return [r0, 1 - r0]
+        if self.objective == 'coop':
+            return [(s0 + s1) / total] * 2
+        # A point of the other agent is worth less than any difference in the agent's own score
+        return [(s0 + s1 / (total + 1)) / (total + 1), (s1 + s0 / (total + 1)) / (total + 1)]
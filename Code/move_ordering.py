@@ -0,0 +1,204 @@
+import math
+import sys
+
+import graph_util
+
+
+class MoveOrdering:
+    """
+    Decides in which order a search tries the successors of a state. The base class keeps the order of
+    State.expand(), subclasses give every successor a sort key (lower keys are searched first, ties keep the expand()
+    order) and can learn from the cutoffs the search reports.
+    The counters tell how good the ordering is: with a perfect ordering every cutoff happens at the first successor.
+    """
+
+    def __init__(self):
+        self.ordered = 0  # Number of successor lists ordered
+        self.cutoffs = 0  # Number of cutoffs reported by the search
+        self.first_move_cutoffs = 0  # Number of cutoffs caused by the successor that was searched first
+
+    def new_decision(self):
+        """
+        Called at the start of every decision
+        """
+        pass
+
+    def order(self, state, successors, ply):
+        """
+        :param state: The expanded state
+        :param successors: Its successors in State.expand() order
+        :param ply: Distance of the state from the root of the search
+        :return: The successors in the order they should be searched
+        """
+        self.ordered += 1
+        if len(successors) < 2:
+            return successors
+        return sorted(successors, key=lambda s: self.key(state, s, ply))
+
+    def key(self, state, child, ply):
+        return 0
+
+    def cutoff(self, state, child, ply, depth, index):
+        """
+        :param child: The successor which caused the cutoff
+        :param depth: The remaining depth at the state
+        :param index: The position of the child in the searched order
+        """
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+
+    def counters(self):
+        return {'ordered': self.ordered, 'cutoffs': self.cutoffs, 'first_move_cutoffs': self.first_move_cutoffs}
+
+
+def get_edge(state, child):
+    """
+    :return: The move leading from state to child as (agent, from node, to node), to node is -1 for termination
+    """
+    return state.agent_turn, state.locations[state.agent_turn][1], child.locations[state.agent_turn][1]
+
+
+class HistoryHeuristic(MoveOrdering):
+    """
+    Moves (agent and edge) that caused cutoffs anywhere in the tree are tried first, weighted by the depth of the
+    subtree they cut. The scores are halved on every decision so old games fade away.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.history = {}
+
+    def new_decision(self):
+        self.history = {edge: score // 2 for edge, score in self.history.items() if score > 1}
+
+    def key(self, state, child, ply):
+        return -self.history.get(get_edge(state, child), 0)
+
+    def cutoff(self, state, child, ply, depth, index):
+        super().cutoff(state, child, ply, depth, index)
+        edge = get_edge(state, child)
+        self.history[edge] = self.history.get(edge, 0) + depth * depth
+
+
+class KillerMoves(MoveOrdering):
+    """
+    The last moves that caused a cutoff at the same ply (in a sibling subtree) are tried first
+    """
+
+    def __init__(self, num_killers=2):
+        super().__init__()
+        self.num_killers = num_killers
+        self.killers = {}
+
+    def new_decision(self):
+        self.killers = {}
+
+    def key(self, state, child, ply):
+        killers = self.killers.get(ply)
+        if killers:
+            edge = get_edge(state, child)
+            for i in range(len(killers)):
+                if killers[i] == edge:
+                    return i
+        return self.num_killers
+
+    def cutoff(self, state, child, ply, depth, index):
+        super().cutoff(state, child, ply, depth, index)
+        edge = get_edge(state, child)
+        killers = self.killers.setdefault(ply, [])
+        if edge not in killers:
+            killers.insert(0, edge)
+            del killers[self.num_killers:]
+
+
+class NearestPeopleOrdering(MoveOrdering):
+    """
+    Static ordering, moves which get the agent closer to the nearest node with people in it are tried first and
+    termination is tried last
+    """
+
+    def order(self, state, successors, ply):
+        self.ordered += 1
+        if len(successors) < 2:
+            return successors
+        distances = graph_util.get_distances_to_people(state.graph, state.node_values)
+        return sorted(successors, key=lambda s: self.distance(state, s, distances))
+
+    def key(self, state, child, ply):
+        return self.distance(state, child, graph_util.get_distances_to_people(state.graph, state.node_values))
+
+    def distance(self, state, child, distances):
+        orig, dest, steps = child.locations[state.agent_turn]
+        if dest == -1:
+            return math.inf
+        return steps + distances[dest]
+
+
+class CompositeOrdering(MoveOrdering):
+    """
+    Orders by the first ordering, ties are broken by the second ordering and so on. Cutoffs are reported to all of them.
+    """
+
+    def __init__(self, *orderings):
+        super().__init__()
+        self.orderings = orderings
+
+    def new_decision(self):
+        for ordering in self.orderings:
+            ordering.new_decision()
+
+    def key(self, state, child, ply):
+        return tuple(ordering.key(state, child, ply) for ordering in self.orderings)
+
+    def cutoff(self, state, child, ply, depth, index):
+        super().cutoff(state, child, ply, depth, index)
+        for ordering in self.orderings:
+            ordering.cutoff(state, child, ply, depth, index)
+
+
+def compare_orderings(state, depth, orderings, **agent_args):
+    """
+    :param state: The state to decide in
+    :param depth: Fixed search depth
+    :param orderings: Dictionary of name to move ordering (or None for the State.expand() order)
+    :param agent_args: More arguments for the agents (e.g. tt_size=0 to compare without a transposition table)
+    :return: Dictionary of name to the counters of one adversarial decision, 'nodes' is the number of nodes visited and
+    'reduction' is the fraction of nodes saved compared to the State.expand() order
+    """
+    from adversarial_agent import AdversarialAgent
+    results = {}
+    baseline = None
+    for name, ordering in [('expand order', None)] + list(orderings.items()):
+        agent = AdversarialAgent(depth, move_ordering=ordering, **agent_args)
+        agent.aid = state.agent_turn
+        agent.act(state)
+        counters = ordering.counters() if ordering is not None else {}
+        counters['nodes'] = agent.nodes
+        if baseline is None:
+            baseline = agent.nodes
+        counters['reduction'] = 1 - agent.nodes / baseline
+        results[name] = counters
+    return results
+
+
+if __name__ == '__main__':
+    # Usage: python move_ordering.py <graph file> <depth> <start vertex 0> <start vertex 1>
+    from csr_graph import CSRGraph
+    from graph_reader import GraphReader
+    from state import State
+
+    graph, deadline = GraphReader().read(sys.argv[1], csr=True)
+    State.graph = CSRGraph.from_graph(graph)
+    start = State(graph_util.graph_to_node_value_list(State.graph),
+                  [[int(sys.argv[3]), int(sys.argv[3]), 0], [int(sys.argv[4]), int(sys.argv[4]), 0]],
+                  deadline=deadline)
+    start.update_people_and_scores()
+    comparison = compare_orderings(start, int(sys.argv[2]), {
+        'history': HistoryHeuristic(),
+        'killers': KillerMoves(),
+        'nearest people': NearestPeopleOrdering(),
+        'killers+history': CompositeOrdering(KillerMoves(), HistoryHeuristic()),
+    })
+    for name, counters in comparison.items():
+        print(f'{name}: {counters}')
@@ -1,18 +1,316 @@
+import math
+import time
+
 import matplotlib.pyplot as plt
 import networkx as nx
 from networkx.drawing.nx_pydot import graphviz_layout
 
+import transposition_table as tt
 from agent import Agent
+from parallel_search import SearchPool
+from search_stats import SearchStats
+from state import State, TERMINATE, WAIT
+
+BUDGET_CHECK_INTERVAL = 256  # Number of nodes searched between two looks at the clock
+
+
+class SearchTimeout(Exception):
+    """
+    Raised from inside a search when the budget of the decision runs out
+    """
+    pass
 
 
 class MultiplayerAgent(Agent):
 
-    def __init__(self, depth):
+    def __init__(self, depth, record_tree=False, time_budget=None, node_budget=None, move_ordering=None,
+                 workers=None, stats=False, tt_size=2 ** 16, tt_replacement='depth', keep_table=True,
+                 in_place=True):
+        """
+        :param depth: Cutoff depth of the search. With a budget this is the deepest iteration, None for no limit
+        :param record_tree: Debug option, keep the whole search tree of the last decision in self.tree (every searched
+        node with its state and value and every edge with its label)
+        :param time_budget: Seconds of wall-clock time per decision, searches by iterative deepening when given
+        :param node_budget: Number of searched nodes per decision, searches by iterative deepening when given
+        :param move_ordering: A MoveOrdering which decides the order successors are searched in, None for the order of
+        State.expand()
+        :param workers: Number of worker processes which search the root successors in parallel, None to search in this
+        process only. Not used while recording the tree
+        :param stats: Collect search statistics in self.stats (a SearchStats)
+        :param tt_size: Number of slots in the transposition table, 0 or None disables the table
+        :param tt_replacement: Replacement policy of the transposition table ('depth' or 'always')
+        :param keep_table: Keep the transposition table between decisions, the next decision searches mostly the same
+        states two plies closer to the root
+        :param in_place: Search below the root on one state, with State.make() and unmake(), instead of a new state for
+        every successor. Makes the same decisions. Not used while recording the tree or with a move ordering
+        """
         super().__init__()
         self.depth = depth
         self.heuristic = None
+        self.record_tree = record_tree
+        self.tree = None
         self.vertex_id = 0
         self.num_call = 0
+        self.time_budget = time_budget
+        self.node_budget = node_budget
+        self.nodes = 0  # Nodes searched in the current decision
+        self.next_check = math.inf  # Number of nodes at which we check the budget again
+        self.time_limit = math.inf
+        self.node_limit = math.inf
+        self.completed_depth = 0  # Depth of the last completed iteration
+        # Whether the last search stopped anywhere because of the depth and not the game end. The searches also use it
+        # to tell whether a subtree was searched to the end of the game, in which case its value holds at any depth
+        self.depth_cutoff = False
+        self.move_ordering = move_ordering
+        self.root_depth = 0  # Depth of the running search, the ply of a node is the root depth minus its depth
+        self.search_pool = SearchPool(workers) if workers is not None and workers > 1 else None
+        self.stats = SearchStats() if stats else None
+        self.transposition_table = tt.TranspositionTable(tt_size, tt_replacement) if tt_size else None
+        self.keep_table = keep_table
+        self.in_place = in_place
+        self.search_in_place = False  # Whether the running search is in place, see run_search
+        # The searches expand and evaluate states through these, see reset_stats
+        self.expand = State.expand
+        self.legal_actions = State.legal_actions
+        self.evaluate = None
+
+    def act(self, state):
+        self.nodes = 0  # Also for a noop, which searches nothing
+        if state.is_agent_moving(self.aid):
+            return ("noop",)
+        start = time.perf_counter()
+        self.new_decision()
+        if self.time_budget is None and self.node_budget is None:
+            best = self.run_search(state, self.depth) if self.depth > 0 else None
+            self.completed_depth = self.depth
+        else:
+            best = self.iterative_deepening(state)
+        # self.print_tree(self.tree)
+        self.num_call += 1
+        if self.stats is not None:
+            self.stats.end_decision(self.search_counters(), self.nodes, self.completed_depth,
+                                    time.perf_counter() - start)
+        return self.get_action(state, best)
+
+    def new_decision(self):
+        """
+        Called at the start of every decision, before any search
+        """
+        self.nodes = 0
+        self.completed_depth = 0
+        # No budget unless iterative deepening sets one, the parallel workers check the limits they are sent
+        self.time_limit = math.inf
+        self.node_limit = math.inf
+        if self.move_ordering is not None:
+            self.move_ordering.new_decision()
+        if self.transposition_table is not None:
+            if self.keep_table:
+                self.transposition_table.new_generation()
+            else:
+                self.transposition_table.clear()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Starts counting the statistics of a search from zero. Without statistics the searches call State.expand(),
+        State.legal_actions() and the heuristic directly
+        """
+        if self.stats is None:
+            self.expand, self.legal_actions, self.evaluate = State.expand, State.legal_actions, self.heuristic
+        else:
+            self.stats.new_decision(State.expand, State.legal_actions, self.heuristic)
+            self.expand, self.legal_actions, self.evaluate = (self.stats.expand, self.stats.legal_actions,
+                                                              self.stats.evaluate)
+
+    def search_counters(self):
+        """
+        :return: The statistics counters of the current decision, only called when collecting statistics
+        """
+        counters = self.stats.counters()
+        if self.transposition_table is not None:
+            counters['tt_probes'] += self.transposition_table.probes
+            counters['tt_hits'] += self.transposition_table.hits
+        return counters
+
+    def run_search(self, state, depth, first=None):
+        """
+        :param first: A move to search first at the root (see move_key)
+        :return: The best successor of the state, or None if there is none
+        """
+        root = None
+        if self.record_tree:
+            # Creating a search tree, keep this field to keep track of vertex ids
+            self.vertex_id = 0
+            self.tree = nx.DiGraph()
+            # Add the root to the tree
+            root = self.vertex_id
+            self.tree.add_node(root, state=state)
+            self.vertex_id += 1
+        self.depth_cutoff = False
+        self.root_depth = depth
+        # The move ordering and the recorded tree need a state per successor
+        self.search_in_place = self.in_place and root is None and self.move_ordering is None
+        if self.search_pool is not None and root is None:
+            return self.search_pool.search_root(self, state, depth, first)
+        return self.search_root(state, depth, root, first)
+
+    def iterative_deepening(self, state):
+        """
+        Searches to depth 1, 2, ... until the budget runs out, and returns the best successor found by the deepest
+        completed iteration. The best move of each iteration is searched first by the next one.
+        """
+        self.time_limit = time.perf_counter() + self.time_budget if self.time_budget is not None else math.inf
+        self.node_limit = self.node_budget if self.node_budget is not None else math.inf
+        best = None
+        tree = None
+        depth = 1
+        while self.depth is None or depth <= self.depth:
+            # The first iteration always runs to the end so that we have an action to return
+            self.next_check = math.inf if depth == 1 else self.nodes + 1
+            try:
+                best = self.run_search(state, depth, self.move_key(state, best))
+            except SearchTimeout:
+                self.tree = tree  # Keep the tree of the last completed iteration
+                break
+            tree = self.tree
+            self.completed_depth = depth
+            if not self.depth_cutoff:  # We searched the whole game tree, searching deeper will not change anything
+                break
+            depth += 1
+        self.next_check = math.inf
+        return best
+
+    def check_budget(self):
+        """
+        Called by the searches every time the node count reaches self.next_check
+        """
+        if self.nodes >= self.node_limit or time.perf_counter() >= self.time_limit:
+            raise SearchTimeout()
+        self.next_check = min(self.nodes + BUDGET_CHECK_INTERVAL, self.node_limit)
+
+    def search_root(self, state, depth, node=None, first=None):
+        """
+        :param state: The current state, where it is this agent's turn
+        :param depth: Depth of search tree
+        :param node: The id (int) of the root in the recorded search tree, None when we are not recording it
+        :param first: A move to search first (see move_key)
+        :return: The best successor of the state, or None if there is none. When successors are equally good, the one
+        that comes first in State.expand() is chosen no matter the order they were searched in
+        """
+        raise NotImplementedError
+
+    def search_child(self, child, depth, bound):
+        """
+        Searches one successor of the root on its own, used by the parallel search
+        :param child: A successor of the root
+        :param depth: Depth of the root search
+        :param bound: The best root_key found so far (see bound_value), the child may return any value whose key is
+        less than the bound if its real value is not better
+        :return: The value of the child
+        """
+        raise NotImplementedError
+
+    def root_key(self, value):
+        """
+        :return: A key of a root successor's value, the successor with the highest key is the best one
+        """
+        return value
+
+    def bound_value(self, key):
+        """
+        :return: The key as a number to share between parallel searches, -inf if the keys can not be used as bounds
+        """
+        return key
+
+    def close(self):
+        if self.search_pool is not None:
+            self.search_pool.close()
+
+    def __getstate__(self):
+        # The pool and the tree stay in this process
+        state = self.__dict__.copy()
+        state['search_pool'] = None
+        state['tree'] = None
+        return state
+
+    def move_key(self, state, child):
+        """
+        :return: The action (see State.legal_actions) which leads from state to child, None for no child. The searches
+        keep their best moves as actions, so the copying and the in place searches share them
+        """
+        if child is None:
+            return None
+        location = state.locations[state.agent_turn]
+        if location[0] == -1 or location[2] != 0:
+            return WAIT
+        dest = child.locations[state.agent_turn][1]
+        if dest == -1:
+            return TERMINATE
+        return location[1], dest, state.graph.get_edge_weight(location[1], dest)
+
+    def successors(self, state, first=None, ply=0):
+        """
+        :param first: An action to search first
+        :param ply: Distance of the state from the root
+        :return: The successors of the state in the order they should be searched. Without a move ordering they are
+        created one at a time as the search gets to them, so the ones after a cutoff are never created
+        """
+        if self.move_ordering is None:
+            return map(state.result, self.first_action(self.legal_actions(state), first))
+        return self.order_successors(state, self.expand(state), first, ply)
+
+    def order_successors(self, state, successors, first=None, ply=0):
+        """
+        :param first: An action to put first, it goes before the order of the move ordering
+        :param ply: Distance of the state from the root
+        """
+        if self.move_ordering is not None:
+            successors = self.move_ordering.order(state, successors, ply)
+        if first is not None:
+            for i in range(len(successors)):
+                if self.move_key(state, successors[i]) == first:
+                    if i > 0:
+                        successors.insert(0, successors.pop(i))
+                    break
+        return successors
+
+    def first_action(self, actions, first):
+        """
+        :param actions: Actions in State.legal_actions() order
+        :param first: An action to search first, None for none
+        :return: The actions in the order they should be searched by an in place search
+        """
+        if first is None or actions[0] == first:
+            return actions
+        for i in range(1, len(actions)):
+            if actions[i] == first:
+                return (first,) + actions[:i] + actions[i + 1:]
+        return actions
+
+    def report_cutoff(self, state, child, ply, depth, index):
+        """
+        Tells the move ordering that child (the index-th successor searched) cut off the search of state
+        """
+        if self.stats is not None:
+            self.stats.cutoffs += 1
+        if self.move_ordering is not None:
+            self.move_ordering.cutoff(state, child, ply, depth, index)
+
+    def record_child(self, node, state, child):
+        """
+        :param node: The id of the state's node in the search tree, None when we are not recording the tree
+        :return: The id of the child's node, or None when we are not recording the tree
+        """
+        if node is None:
+            return None
+        self.tree.add_node(self.vertex_id, state=child)
+        self.tree.add_edge(node, self.vertex_id, label=self.get_edge_label(state, child))
+        self.vertex_id += 1
+        return self.vertex_id - 1
+
+    def record_value(self, node, value):
+        if node is not None:
+            self.tree.nodes[node]['value'] = value
 
     def get_edge_label(self, curr_state, next_state):
         """
@@ -0,0 +1,133 @@
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from state import State
+
+# The bound shared by all the searches of a pool, set once in every worker process. It is an array of the generation
+# of the root search it belongs to and the bound itself, read and written together under its lock
+shared_bound = None
+GENERATION, VALUE = 0, 1
+
+
+def init_worker(graph, options, bound):
+    """
+    Runs once in every worker process, so the graph is shipped to a worker once and not with every task
+    """
+    global shared_bound
+    State.graph = graph
+    State.set_options(options)
+    shared_bound = bound
+
+
+def search_child(agent, child, depth, index, generation):
+    """
+    Runs in a worker process
+    :param agent: A copy of the searching agent (without its pool and transposition table contents)
+    :param child: A successor of the root
+    :param depth: Depth of the root search
+    :param index: Index of the child in State.expand() order
+    :param generation: Generation of the root search (see SearchPool.search_root)
+    :return: (index, value of the child, nodes searched, whether the search was cut off by depth, statistics
+    counters or None), the value is None if the root search is already over
+    """
+    bound = read_bound(shared_bound, generation)
+    if bound is None:  # Left over from a root search that timed out or failed, nobody waits for it
+        return index, None, 0, False, None
+    # The budget is whatever the agent had left when the task was sent
+    agent.node_limit -= agent.nodes
+    agent.nodes = 0
+    agent.next_check = 1 if agent.node_limit < math.inf or agent.time_limit < math.inf else math.inf
+    agent.depth_cutoff = False
+    agent.reset_stats()
+    value = agent.search_child(child, depth, bound)
+    update_bound(shared_bound, generation, agent.bound_value(agent.root_key(value)))
+    return index, value, agent.nodes, agent.depth_cutoff, agent.search_counters() if agent.stats is not None else None
+
+
+def read_bound(bound, generation):
+    """
+    :return: The bound of the root search of the generation, None if another root search has started since
+    """
+    with bound.get_lock():
+        return bound[VALUE] if bound[GENERATION] == generation else None
+
+
+def update_bound(bound, generation, value):
+    """
+    Raises the bound of the root search of the generation, unless another root search has started since
+    """
+    with bound.get_lock():
+        if bound[GENERATION] == generation and value > bound[VALUE]:
+            bound[VALUE] = value
+
+
+class SearchPool:
+    """
+    A pool of worker processes which search root successors in parallel, kept alive between decisions. The workers
+    get State.graph and the State options when they start, so the pool is restarted if they change.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.bound = multiprocessing.Array('d', [0, -math.inf])  # [generation, bound], see shared_bound
+        self.generation = 0
+        self.executor = None
+        self.graph = None
+        self.options = None
+
+    def get_executor(self):
+        if self.executor is None or self.graph is not State.graph or self.options != State.get_options():
+            self.close()
+            self.graph = State.graph
+            self.options = State.get_options()
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                                initargs=(self.graph, self.options, self.bound))
+        return self.executor
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def search_root(self, agent, state, depth, first=None):
+        """
+        Young brothers wait: the successor that is searched first is searched here, and the rest are then searched in
+        parallel with its value as the bound. Every worker that finds a better value raises the shared bound for the
+        searches that start after it.
+        :return: The best successor of the state, or None if there is none
+        """
+        successors = agent.expand(state)
+        if not successors:
+            return None
+        index = {id(s): i for i, s in enumerate(successors)}
+        ordered = agent.order_successors(state, list(successors), first)
+        best = ordered[0]
+        best_index = index[id(best)]
+        best_key = agent.root_key(agent.search_child(best, depth, -math.inf))
+        if len(ordered) == 1:
+            return best
+        # Every root search has a new generation of the bound, tasks of an earlier search that are still running can
+        # not raise it
+        self.generation += 1
+        with self.bound.get_lock():
+            self.bound[GENERATION] = self.generation
+            self.bound[VALUE] = agent.bound_value(best_key)
+        executor = self.get_executor()
+        futures = [executor.submit(search_child, agent, s, depth, index[id(s)], self.generation)
+                   for s in ordered[1:]]
+        try:
+            for future in as_completed(futures):
+                i, value, nodes, depth_cutoff, counters = future.result()
+                agent.nodes += nodes
+                if counters is not None:
+                    agent.stats.add(counters)
+                agent.depth_cutoff = agent.depth_cutoff or depth_cutoff
+                key = agent.root_key(value)
+                if key > best_key or (key == best_key and i < best_index):
+                    best, best_key, best_index = successors[i], key, i
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        return best
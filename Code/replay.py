@@ -0,0 +1,116 @@
+import argparse
+import json
+import sys
+
+from csr_graph import CSRGraph
+from game_record import read_record
+from graph_reader import GraphReader
+from simulator import Simulator
+from state import State
+
+
+class ReplaySimulator(Simulator):
+    """
+    Plays a recorded game again. From a given act() call of the record on, the agents decide in every position and
+    their actions are compared with the recorded ones. The game always goes on with the recorded action, so every
+    position is the recorded one even after a decision changed.
+    The act() calls before the start are not made (their recorded actions are played), so an agent whose decisions
+    depend on its earlier ones may decide differently after the start. This does not change the decisions of the
+    minimax agents, MCTS draws its random numbers from one generator over the whole game and has to be replayed from
+    the start.
+    """
+
+    def __init__(self, record, graph, start=0, **search_args):
+        """
+        :param record: File of the record (see GameRecorder)
+        :param graph: The graph of the recorded game (networkx or CSRGraph)
+        :param start: Index of the first act() call of the record to make again
+        :param search_args: Arguments of the agents that replace the recorded ones
+        """
+        super().__init__(interactive=False, verbose=False)
+        self.game, self.acts, self.result = read_record(record)
+        graph = CSRGraph.from_graph(graph)
+        if graph.digest() != self.game['graph_hash']:
+            raise ValueError('The graph is not the graph of the recorded game')
+        if self.game['search'] == 'mcts' and dict(self.game['search_args'], **search_args).get('seed') is None:
+            raise ValueError('The MCTS game was recorded without a seed, its random playouts can not be replayed')
+        self.start = start
+        self.moves = []  # One per act() call of the record, see decide
+        State.set_options(self.game['state_options'])
+        self.setup(graph, self.game['deadline'], self.game['game_type'], self.game['starts'], self.game['search'],
+                   **dict(self.game['search_args'], **search_args))
+
+    def decide(self, agent):
+        """
+        :return: The recorded action. The decision of the agent is kept in self.moves, a dictionary per act() call with
+        the recorded action, seconds and nodes, and from the start on the action, seconds and nodes of the agent now,
+        whether the action is the same and the difference in seconds
+        """
+        index = len(self.moves)
+        if index >= len(self.acts):
+            raise ValueError('The game goes on after the end of the record')
+        aid, current_time, recorded, recorded_seconds, recorded_nodes = self.acts[index]
+        if aid != agent.aid or current_time != self.state.current_time:
+            raise ValueError(f'Act {index} of the record is not of agent {agent.aid} at time {self.state.current_time}')
+        move = {'index': index, 'agent': aid, 'time': current_time, 'recorded_action': recorded,
+                'recorded_seconds': recorded_seconds, 'recorded_nodes': recorded_nodes}
+        if index >= self.start:
+            before = self.agent_times[aid]
+            action = list(super().decide(agent))
+            seconds = self.agent_times[aid] - before
+            move.update(action=action, same=action == recorded, seconds=seconds, delta=seconds - recorded_seconds,
+                        nodes=getattr(agent, 'nodes', None))
+        self.moves.append(move)
+        return tuple(recorded)
+
+    def report(self):
+        """
+        :return: The moves (see decide), the indices of the changed decisions, the seconds the replayed decisions took
+        in the record and now, and whether the game ended as recorded
+        """
+        replayed = [move for move in self.moves if 'action' in move]
+        recorded_seconds = sum(move['recorded_seconds'] for move in replayed)
+        seconds = sum(move['seconds'] for move in replayed)
+        result = {'scores': list(self.state.scores), 'rounds': self.num_rounds, 'final_time': self.state.current_time}
+        return {'moves': self.moves, 'replayed': len(replayed),
+                'changed': [move['index'] for move in replayed if not move['same']],
+                'recorded_seconds': recorded_seconds, 'seconds': seconds,
+                'speedup': recorded_seconds / seconds if seconds > 0 else None,
+                'result_matches': len(self.moves) == len(self.acts) and result == self.result}
+
+
+def replay(record, graph_path, start=0, **search_args):
+    """
+    Replays a recorded game (see ReplaySimulator)
+    :param graph_path: File of the graph of the recorded game
+    :return: The report of the replay (see ReplaySimulator.report)
+    """
+    graph, _ = GraphReader().read(graph_path, verbose=False, csr=True)
+    simulator = ReplaySimulator(record, graph, start, **search_args)
+    simulator.run_environment()
+    return simulator.report()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a recorded game, check that the agents decide the same and '
+                                                 'compare the time of every decision with the record')
+    parser.add_argument('record', help='Record of the game (see GameRecorder)')
+    parser.add_argument('graph', help='Graph file of the game')
+    parser.add_argument('-s', '--start', type=int, default=0, help='Index of the first act() call to make again')
+    parser.add_argument('--options', default='{}', help='JSON of agent arguments that replace the recorded ones')
+    parser.add_argument('-o', '--output', help='File to write the report to (JSON)')
+    args = parser.parse_args()
+    report = replay(args.record, args.graph, args.start, **json.loads(args.options))
+    for move in report['moves']:
+        if 'action' in move and move['recorded_action'] != ['noop']:
+            change = '' if move['same'] else f' CHANGED, recorded {move["recorded_action"]}'
+            print(f'{move["index"]:4d} agent {move["agent"]} time {move["time"]}: {move["action"]}{change}, '
+                  f'{move["recorded_seconds"]:.4f}s -> {move["seconds"]:.4f}s ({move["delta"]:+.4f}s)')
+    speedup = f'{report["speedup"]:.2f}x' if report['speedup'] is not None else '-'
+    print(f'{report["replayed"]} decisions replayed, {len(report["changed"])} changed, '
+          f'{report["recorded_seconds"]:.4f}s -> {report["seconds"]:.4f}s (speedup {speedup}), '
+          f'result {"as recorded" if report["result_matches"] else "DIFFERENT"}')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    sys.exit(0 if not report['changed'] and report['result_matches'] else 1)
@@ -0,0 +1,89 @@
+import time
+
+COUNTERS = ['expansions', 'evals', 'cutoffs', 'tt_probes', 'tt_hits', 'expand_time', 'eval_time']
+
+
+class TimedCall:
+    """
+    Calls a function and keeps the number of calls and the time spent in them
+    """
+    __slots__ = ('function', 'calls', 'seconds')
+
+    def __init__(self, function):
+        self.function = function
+        self.calls = 0
+        self.seconds = 0.0
+
+    def __call__(self, *args):
+        start = time.perf_counter()
+        result = self.function(*args)
+        self.seconds += time.perf_counter() - start
+        self.calls += 1
+        return result
+
+
+class SearchStats:
+    """
+    Counters of the searches of an agent, for the current (or last) decision and summed over all its decisions.
+    The agent searches through self.expand, self.legal_actions and self.evaluate, which count and time the calls to
+    State.expand(), State.legal_actions() (both count as expansions) and the heuristic. Without statistics the agent
+    calls them directly, so a disabled agent pays nothing for this.
+    """
+
+    def __init__(self):
+        self.expand = None
+        self.legal_actions = None
+        self.evaluate = None
+        self.cutoffs = 0  # Subtrees cut off by alpha-beta or by branch and bound
+        self.added = dict.fromkeys(COUNTERS, 0)  # Counters of searches that ran in other processes
+        self.last = None  # Counters of the last finished decision
+        self.total = dict.fromkeys(COUNTERS + ['nodes', 'depth', 'search_time'], 0)
+        self.decisions = 0
+
+    def new_decision(self, expand, legal_actions, heuristic):
+        self.expand = TimedCall(expand)
+        self.legal_actions = TimedCall(legal_actions)
+        self.evaluate = TimedCall(heuristic)
+        self.cutoffs = 0
+        self.added = dict.fromkeys(COUNTERS, 0)
+
+    def counters(self):
+        """
+        :return: The counters of the current decision so far
+        """
+        counters = {'expansions': self.expand.calls + self.legal_actions.calls, 'evals': self.evaluate.calls,
+                    'cutoffs': self.cutoffs, 'tt_probes': 0, 'tt_hits': 0,
+                    'expand_time': self.expand.seconds + self.legal_actions.seconds, 'eval_time': self.evaluate.seconds}
+        for name in COUNTERS:
+            counters[name] += self.added[name]
+        return counters
+
+    def add(self, counters):
+        for name in COUNTERS:
+            self.added[name] += counters[name]
+
+    def end_decision(self, counters, nodes, depth, seconds):
+        """
+        :param counters: Counters of the decision (see MultiplayerAgent.search_counters)
+        :param nodes: Number of nodes searched
+        :param depth: Depth of the deepest completed search
+        :param seconds: Wall-clock time of the decision
+        """
+        self.last = dict(counters, nodes=nodes, depth=depth, search_time=seconds)
+        for name, value in self.last.items():
+            self.total[name] += value
+        self.decisions += 1
+
+    def as_dict(self):
+        return {'decisions': self.decisions, 'last': self.last, 'total': self.total}
+
+    def report(self):
+        total = self.total
+        if self.decisions == 0:
+            return 'No decisions'
+        nodes_per_sec = total['nodes'] / total['search_time'] if total['search_time'] > 0 else 0
+        return (f"{self.decisions} decisions, {total['nodes']} nodes ({nodes_per_sec:.0f}/sec), "
+                f"{total['expansions']} expansions, {total['evals']} evals, {total['cutoffs']} cutoffs, "
+                f"{total['tt_hits']}/{total['tt_probes']} TT hits, "
+                f"average depth {total['depth'] / self.decisions:.1f}, time {total['search_time']:.3f}s "
+                f"(expand {total['expand_time']:.3f}s, eval {total['eval_time']:.3f}s)")
@@ -1,72 +1,127 @@
 import math
 
-import networkx as nx
-
+import transposition_table as tt
 from multiplayer_agent import MultiplayerAgent
 
 
 class SemiCoopAgent(MultiplayerAgent):
-    def __init__(self, depth):
-        super().__init__(depth)
+    def __init__(self, depth, **kwargs):
+        super().__init__(depth, **kwargs)
         self.heuristic = semi_cooperative_heuristic
 
-    def act(self, state):
-        if state.is_agent_moving(self.aid):
-            return ("noop",)
-        self.vertex_id = 0
-        tree = nx.DiGraph()
-        tree.add_node(self.vertex_id, state=state)
-        self.vertex_id += 1
-        self.expand_minmax_tree(tree, 0, self.depth)
-        self.num_call += 1
-        return self.select_best_branch(tree)
+    def search_root(self, state, depth, node=None, first=None):
+        best = None
+        best_value = [-math.inf, -math.inf]
+        best_index = math.inf
+        self.nodes += 1
+        search = self.expand_minmax_tree_in_place if self.search_in_place else self.expand_minmax_tree
+        successors = self.expand(state)
+        index = {id(s): i for i, s in enumerate(successors)}
+        for s in self.order_successors(state, successors, first):
+            i = index[id(s)]
+            value = search(s, depth - 1, self.record_child(node, state, s))
+            # Pick best action which maximizes the current player's score, break ties cooperatively
+            if is_better(value, best_value, self.aid) or (value == best_value and i < best_index):
+                best_value = value
+                best, best_index = s, i
+        self.record_value(node, best_value)
+        return best
+
+    def search_child(self, child, depth, bound):
+        if self.search_in_place:
+            return self.expand_minmax_tree_in_place(child, depth - 1)
+        return self.expand_minmax_tree(child, depth - 1)
 
-    def expand_minmax_tree(self, tree, node, depth):
+    def root_key(self, value):
+        # Own score first, ties are broken by the other player's score
+        return value[self.aid], value[1 - self.aid]
+
+    def bound_value(self, key):
+        # Nothing is pruned in this search, so there is no bound to share
+        return -math.inf
+
+    def expand_minmax_tree(self, state, depth, node=None):
         """
-        :param tree: The tree we're constructing
-        :param node: The id (int) of the root of the current subtree
+        :param state: The state at the root of the current subtree
         :param depth: Depth of search tree
+        :param node: The id (int) of the root of the current subtree in the recorded search tree, None if not recording
         :return: Value of root node
         Both players are trying to maximize their own score, but they break ties cooperatively.
         """
-        state = tree.nodes[node]['state']
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_budget()
         if depth == 0 or state.is_state_terminal():
-            tree.nodes[node]['value'] = self.heuristic(state)
-            return self.heuristic(state)
+            if depth == 0:
+                self.depth_cutoff = True
+            value = self.evaluate(state)
+            self.record_value(node, value)
+            return value
+        # Nothing is pruned, so every value in the transposition table is exact
+        table = self.transposition_table
+        if table is not None:
+            entry = table.probe(state.zobrist_hash)
+            if entry is not None and entry[1] >= depth:
+                self.depth_cutoff = self.depth_cutoff or entry[1] != tt.COMPLETE
+                self.record_value(node, entry[2])
+                return entry[2]
+        outer_cutoff = self.depth_cutoff
+        self.depth_cutoff = False
         value = [-math.inf, -math.inf]  # Value is an ordered pair of [player0, player1]
-        for s in state.expand():
-            tree.add_node(self.vertex_id, state=s)
-            tree.add_edge(node, self.vertex_id, label=self.get_edge_label(state, s))
-            self.vertex_id += 1
-            s_value = self.expand_minmax_tree(tree, self.vertex_id - 1, depth - 1)
+        for s in self.expand(state):
+            s_value = self.expand_minmax_tree(s, depth - 1, self.record_child(node, state, s))
             # If the successor node has better value than the current value (for all successor nodes), update it. If it
             # is equal, use the tiebreaker
-            if s_value[state.agent_turn] > value[state.agent_turn]:
+            if is_better(s_value, value, state.agent_turn):
                 value = s_value
-            elif (s_value[state.agent_turn] == value[state.agent_turn]) and (
-                    s_value[1 - state.agent_turn] > value[1 - state.agent_turn]):
+        self.record_value(node, value)
+        if table is not None:
+            table.store(state.zobrist_hash, depth if self.depth_cutoff else tt.COMPLETE, value, tt.EXACT)
+        self.depth_cutoff = self.depth_cutoff or outer_cutoff
+        return value
+
+    def expand_minmax_tree_in_place(self, state, depth, node=None):
+        """
+        The same search as expand_minmax_tree, on the state itself: every successor is made on it and unmade after its
+        subtree is searched, so the state is as it was when this returns (but not when the search runs out of budget)
+        :param node: Not used, the tree is not recorded in place
+        :return: Value of the state
+        """
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_budget()
+        if depth == 0 or state.is_state_terminal():
+            if depth == 0:
+                self.depth_cutoff = True
+            return self.evaluate(state)
+        table = self.transposition_table
+        if table is not None:
+            entry = table.probe(state.zobrist_hash)
+            if entry is not None and entry[1] >= depth:
+                self.depth_cutoff = self.depth_cutoff or entry[1] != tt.COMPLETE
+                return entry[2]
+        outer_cutoff = self.depth_cutoff
+        self.depth_cutoff = False
+        value = [-math.inf, -math.inf]
+        turn = state.agent_turn
+        for action in self.legal_actions(state):
+            undo = state.make(action)
+            s_value = self.expand_minmax_tree_in_place(state, depth - 1)
+            state.unmake(undo)
+            if is_better(s_value, value, turn):
                 value = s_value
-        tree.nodes[node]['value'] = value
+        if table is not None:
+            table.store(state.zobrist_hash, depth if self.depth_cutoff else tt.COMPLETE, value, tt.EXACT)
+        self.depth_cutoff = self.depth_cutoff or outer_cutoff
         return value
 
-    def select_best_branch(self, tree):
-        curr_loc = tree.nodes[0]['state'].locations[self.aid][1]
-        move_to = -1
-        best = [-math.inf, -math.inf]
-        for s in tree.successors(0):
-            # Pick best action which maximizes the current player's score, break ties cooperatively
-            if tree.nodes[s]['value'][self.aid] > best[self.aid]:
-                best = tree.nodes[s]['value']
-                move_to = tree.nodes[s]['state'].locations[self.aid][1]
-            elif (tree.nodes[s]['value'][self.aid]) == best[self.aid] and (
-                    tree.nodes[s]['value'][1 - self.aid] > best[1 - self.aid]):
-                best = tree.nodes[s]['value']
-                move_to = tree.nodes[s]['state'].locations[self.aid][1]
-        if move_to != -1:
-            action = ("move", curr_loc, move_to)
-        else:
-            action = ("terminate",)
-        return action
+
+def is_better(value, best, aid):
+    """
+    :return: Whether value is better than best for player aid, which maximizes its own score and breaks ties by
+    maximizing the other player's score
+    """
+    return value[aid] > best[aid] or (value[aid] == best[aid] and value[1 - aid] > best[1 - aid])
 
 
 def semi_cooperative_heuristic(state):
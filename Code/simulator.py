@@ -1,13 +1,22 @@
+import random
+import time
 from enum import Enum
 
 import graph_util
 from adversarial_agent import AdversarialAgent
 from cooperative_agent import CooperativeAgent
+from csr_graph import CSRGraph
+from exact_solver import ExactAgent
+from game_output import GameOutput
+from game_record import GameRecorder
 from graph_reader import GraphReader
 from human_agent import HAgent
+from mcts_agent import MCTSAgent
 from semi_coop_agent import SemiCoopAgent
 from state import State
 
+default_state_options = State.get_options()
+
 
 class GameType(Enum):
     ADVERSARIAL = 0
@@ -15,28 +24,150 @@ class GameType(Enum):
     COOP = 2
 
 
+def parse_game_type(gametype):
+    """
+    :param gametype: The game type as entered by the user
+    :return: The GameType, or -1 for a game of human agents
+    """
+    gametype = str(gametype).lower()
+    if gametype in ["0", "a"]:
+        return GameType.ADVERSARIAL
+    elif gametype in ["1", "s", "sc"]:
+        return GameType.SEMICOOP
+    elif gametype in ["2", "c"]:
+        return GameType.COOP
+    elif gametype in ["h"]:
+        return -1
+    raise ValueError('Game type not recognized')
+
+
+def make_agents(gametype, search='minimax', **search_args):
+    """
+    :param gametype: The game type as entered by the user ("a", "s", "c", "h" or the game type number)
+    :param search: 'minimax' for the agent of the game type, 'mcts' for an MCTSAgent or 'exact' for an ExactAgent
+    with the game type's objective
+    :param search_args: Arguments of the agents (depth, time_budget, ...), not used by human and exact agents
+    :return: (game type, list of the two agents)
+    """
+    game_type = parse_game_type(gametype)
+    if search not in ['minimax', 'mcts', 'exact']:
+        raise ValueError('Search algorithm not recognized')
+    objective = {GameType.ADVERSARIAL: 'adversarial', GameType.SEMICOOP: 'semicoop', GameType.COOP: 'coop'}
+    if search == 'mcts' and game_type != -1:
+        agents = [MCTSAgent(objective[game_type], **search_args), MCTSAgent(objective[game_type], **search_args)]
+    elif search == 'exact' and game_type != -1:
+        agents = [ExactAgent(objective[game_type]), ExactAgent(objective[game_type])]
+    elif game_type == GameType.ADVERSARIAL:
+        agents = [AdversarialAgent(**search_args), AdversarialAgent(**search_args)]
+    elif game_type == GameType.SEMICOOP:
+        agents = [SemiCoopAgent(**search_args), SemiCoopAgent(**search_args)]
+    elif game_type == GameType.COOP:
+        agents = [CooperativeAgent(**search_args), CooperativeAgent(**search_args)]
+    else:
+        agents = [HAgent(), HAgent()]
+    # Agent ids are the turn order in this game, no matter how many agents were created before
+    for aid in range(len(agents)):
+        agents[aid].aid = aid
+    return game_type, agents
+
+
 class Simulator:
-    def __init__(self):
+    def __init__(self, interactive=True, verbose=True, stats=False, record=None, level=None, events=None):
+        """
+        :param interactive: Ask the user for the game settings, otherwise call setup() before running
+        :param verbose: Print the game to the console, the same as level 'full' (and False as level 'quiet')
+        :param stats: Collect search statistics of the agents and print them at the end of the game
+        :param record: File to record the game in (see GameRecorder, replay.py replays it), None for no record
+        :param level: How much of the game to print (see GameOutput), replaces verbose when given
+        :param events: File to write the events of the game to as JSON lines (see GameOutput), None for none
+        """
         self.game_type = -1
+        self.search = None
         self.state = None
         self.agents = []
-        self.user_input()
+        self.verbose = verbose
+        self.output = GameOutput(level if level is not None else 'full' if verbose else 'quiet', events)
+        self.agent_times = []  # Wall-clock seconds spent in act() by every agent
+        self.num_rounds = 0
+        self.stats = stats
+        self.record = record
+        self.recorder = None
+        if interactive:
+            self.user_input()
+
+    def setup(self, graph, deadline, gametype, locs, search='minimax', state_options=None, **search_args):
+        """
+        :param graph: The graph of the game (networkx or CSRGraph)
+        :param deadline: The deadline of the game
+        :param gametype: The game type (see make_agents)
+        :param locs: Starting vertex ids of the agents
+        :param search: The search algorithm of the agents (see make_agents)
+        :param state_options: State options of the search which replace the defaults, e.g. {"macro_steps": true} (see
+        State.set_options), None to keep the current ones
+        :param search_args: Arguments of the agents
+        """
+        if state_options is not None:
+            State.set_options(dict(default_state_options, **state_options))
+        if self.stats and search == 'minimax':
+            search_args['stats'] = True
+        if self.record is not None and search == 'mcts' and search_args.get('seed') is None:
+            # The game can only be replayed with the seed of the random playouts, so it is chosen here and recorded
+            search_args['seed'] = random.randrange(2 ** 32)
+        self.game_type, self.agents = make_agents(gametype, search, **search_args)
+        self.search = search
+        self.agent_times = [0.0] * len(self.agents)
+        State.graph = CSRGraph.from_graph(graph)
+        self.state = State(graph_util.graph_to_node_value_list(State.graph),
+                           [[loc, loc, 0] for loc in locs],
+                           deadline=deadline)
+        if self.record is not None:
+            self.recorder = GameRecorder(self.record)
+            self.recorder.start(State.graph, deadline, gametype, search, search_args, locs, State.get_options())
 
     def run_environment(self):
-        self.start_print()
         self.state.update_people_and_scores()
-        self.print()
-
-        while True:
+        self.output.start(self.state, self.game_type.name.lower() if self.game_type != -1 else 'human', self.search)
+        try:
+            while True:
+                scores = self.state.scores
+                actions = []
+                # While every agent is on an edge or terminated the agents can only wait, so the rounds until one of
+                # them reaches a node are played at once
+                rounds = self.state.skip_rounds()
+                if rounds == 0:
+                    for agent in self.agents:
+                        action = self.decide(agent)
+                        actions.append((agent.aid, action))
+                        self.update_state(action, agent.aid)
+                    rounds = 1
+                self.num_rounds += rounds
+                self.output.round(self.state, actions, rounds, scores)
+                if self.termination():
+                    break
             for agent in self.agents:
-                observation = agent.observe(self.state)
-                action = agent.act(observation)
-                self.update_state(action, agent.aid)
-            if not self.state.are_all_agents_moving_or_terminated():
-                self.print()
-            if self.termination():
-                break
-        self.end_print()
+                agent.close()
+            if self.recorder is not None:
+                self.recorder.end(self.state, self.num_rounds)
+            self.output.end(self.state, self.num_rounds, self.agent_times, self.search_stats())
+        finally:
+            self.output.close()
+        if self.stats:
+            self.print_stats()
+
+    def decide(self, agent):
+        """
+        :return: The action of the agent in the current state
+        """
+        if isinstance(agent, HAgent):
+            self.output.flush()  # The human has to see the game before deciding
+        observation = agent.observe(self.state)
+        start = time.perf_counter()
+        action = agent.act(observation)
+        seconds = time.perf_counter() - start
+        self.agent_times[agent.aid] += seconds
+        if self.recorder is not None:
+            self.recorder.act(agent.aid, self.state.current_time, action, seconds, getattr(agent, 'nodes', None))
+        return action
 
     def update_state(self, action, aid):
         if action[0] != "noop":
@@ -49,50 +180,49 @@ class Simulator:
                 self.state.terminate_agent(aid)
         self.state.advance_turn()
         if aid == len(self.agents) - 1:  # If the last agent has acted, we update the game in one time unit
-            self.state.update_moving_agents()
-            self.state.advance_time()
-            # Do not update if the current time is greater than the deadline (e.g., current time 2, deadline is 2.5, and
-            # we advance to 3)
-            if self.state.current_time <= self.state.deadline:
-                self.state.update_people_and_scores()
+            # People are not collected if the current time is greater than the deadline (e.g., current time 2, deadline
+            # is 2.5, and we advance to 3)
+            self.state.end_round()
+
+    def search_stats(self):
+        """
+        :return: The search statistics (see SearchStats.as_dict) of every agent, None for an agent without them
+        """
+        return [agent.stats.as_dict() if getattr(agent, 'stats', None) is not None else None for agent in self.agents]
+
+    def print_stats(self):
+        for agent in self.agents:
+            if getattr(agent, 'stats', None) is not None:
+                print(f"Agent {agent.aid} search: {agent.stats.report()}")
 
     def termination(self):
         return self.state.is_state_terminal()
 
     def user_input(self):
         print("Insert graph file path:")
-        graph, deadline = GraphReader().read(input().replace('"', ''))
-        cutoff_depth = int(input("Enter cutoff depth: "))
-        gametype = input("Enter game type: ").lower()
-        # Add correct agent types
-        if gametype in ["0", "a"]:
-            self.game_type = GameType.ADVERSARIAL
-            self.agents = [AdversarialAgent(cutoff_depth), AdversarialAgent(cutoff_depth)]
-        elif gametype in ["1", "s", "sc"]:
-            self.game_type = GameType.SEMICOOP
-            self.agents = [SemiCoopAgent(cutoff_depth), SemiCoopAgent(cutoff_depth)]
-        elif gametype in ["2", "c"]:
-            self.game_type = GameType.COOP
-            self.agents = [CooperativeAgent(cutoff_depth), CooperativeAgent(cutoff_depth)]
-        elif gametype in ["h"]:
-            self.agents = [HAgent(), HAgent()]
+        graph, deadline = GraphReader().read(input().replace('"', ''), csr=True)
+        # Either a cutoff depth, or a time per move in seconds (e.g. "0.5s") to search by iterative deepening
+        cutoff = input("Enter cutoff depth (or time per move, e.g. 0.5s): ").strip().lower()
+        if cutoff.endswith("s"):
+            search_args = dict(depth=None, time_budget=float(cutoff[:-1]))
         else:
-            raise ValueError('Game type not recognized')
-
+            search_args = dict(depth=int(cutoff))
+        gametype = input("Enter game type: ").lower()
+        parse_game_type(gametype)  # Fail on an unknown game type before asking for the locations
         locs = [int(input("Starting vertex id for agent 0: ")), int(input("Starting vertex id for agent 1: "))]
-        State.graph = graph
-        self.state = State(graph_util.graph_to_node_value_list(graph),
-                           [[locs[0], locs[0], 0], [locs[1], locs[1], 0]],
-                           deadline=deadline)
-
-    def print(self):
-        print('-' * 20)
-        self.state.print()
-
-    def start_print(self):
-        print("STARTING SIMULATION")
-        print('-' * 20)
-
-    def end_print(self):
-        print('-' * 20)
-        print("END OF RUN")
+        # Asked after the classic questions so their answers keep their places, inputs which end before it play minimax
+        try:
+            search = input("Enter search algorithm (minimax, mcts or exact, default minimax): ").strip().lower()
+        except EOFError:
+            search = ""
+        search = search or "minimax"
+        if search == "exact":
+            search_args = {}
+        elif search == "mcts":
+            # Either a number of iterations, or a time per move in seconds (e.g. "0.5s")
+            budget = input("Enter iterations per move (or time per move, e.g. 0.5s): ").strip().lower()
+            if budget.endswith("s"):
+                search_args = dict(iterations=None, time_budget=float(budget[:-1]))
+            else:
+                search_args = dict(iterations=int(budget))
+        self.setup(graph, deadline, gametype, locs, search, **search_args)
@@ -1,54 +1,220 @@
-import copy
+import math
 
 import graph_util
+from zobrist import Zobrist
+
+# Actions of State.make(): a move is the (origin, destination, weight) location the agent sets out to, and an agent on
+# an edge or terminated can only wait
+TERMINATE = (-1, -1, 0)
+WAIT = None
+TERMINATE_ONLY = (TERMINATE,)
+WAIT_ONLY = (WAIT,)
 
 
 class State:
-    graph = None
+    """
+    A state of the game. The node values, locations and scores are kept in tuples, so a successor shares every part of
+    its parent that it does not change, and a method that changes the state replaces the changed tuple instead of
+    mutating it. Locations are (origin, destination, steps left) triplets, one per agent.
+    """
+    __slots__ = ('node_values', 'locations', 'scores', 'current_time', 'agent_turn', 'deadline', 'people',
+                 'zobrist_hash')
+    graph = None  # The CSRGraph of the game
+    zobrist = Zobrist()
+    # Do not generate moves from which the agent can not reach people before the deadline. The agent can still
+    # terminate, which leaves the scores the same as any of the dropped moves would
+    prune_unreachable = False
+    # Macro steps: a round after which every agent is on an edge or terminated goes straight on to the round in which an
+    # agent reaches a node (or the deadline), see skip_rounds. A ply of the search can then cover many time units
+    macro_steps = False
+
+    @classmethod
+    def get_options(cls):
+        return {'prune_unreachable': cls.prune_unreachable, 'macro_steps': cls.macro_steps}
+
+    @classmethod
+    def set_options(cls, options):
+        for name, value in options.items():
+            setattr(cls, name, value)
 
     def __init__(self, node_values, agents_locations, deadline=-1, scores=None, current_time=0, agent_turn=0):
-        self.node_values = copy.copy(node_values)
+        self.node_values = tuple(node_values)
         self.current_time = current_time
         self.agent_turn = agent_turn
-        self.scores = copy.copy(scores) if scores is not None else [0, 0]
-        self.locations = copy.deepcopy(agents_locations)
+        self.scores = tuple(scores) if scores is not None else (0, 0)
+        self.locations = tuple(tuple(loc) for loc in agents_locations)
         self.deadline = deadline
+        self.people = sum(self.node_values)
+        # The hash is kept up to date by every method that changes the state, so it is only computed from scratch here
+        self.zobrist_hash = self.compute_hash()
+
+    def compute_hash(self):
+        # The deadline does not change during a game, but states of games with other deadlines have other values (a
+        # kept transposition table may see both)
+        h = (self.zobrist.time_key(self.current_time) ^ self.zobrist.turn_key(self.agent_turn) ^
+             self.zobrist.deadline_key(self.deadline))
+        for i in range(len(self.locations)):
+            h ^= self.zobrist.location_key(i, self.locations[i]) ^ self.zobrist.score_key(i, self.scores[i])
+        for i in range(len(self.node_values)):
+            if self.node_values[i] > 0:
+                h ^= self.zobrist.people_key(i, self.node_values[i])
+        return h
+
+    def to_dict(self):
+        """
+        :return: The state as a dictionary of JSON types (see from_dict), the graph is not part of it
+        """
+        return {'node_values': list(self.node_values), 'locations': [list(loc) for loc in self.locations],
+                'scores': list(self.scores), 'current_time': self.current_time, 'agent_turn': self.agent_turn,
+                'deadline': self.deadline}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        :param data: A dictionary of to_dict(). Only the locations are needed: the node values default to the people
+        of State.graph at the start of the game, and the rest to the start of a game without a deadline
+        :return: The state, as it is (people at the agents' nodes are not collected)
+        """
+        node_values = data.get('node_values')
+        return cls(node_values if node_values is not None else cls.graph.node_values, data['locations'],
+                   deadline=data.get('deadline', -1), scores=data.get('scores'),
+                   current_time=data.get('current_time', 0), agent_turn=data.get('agent_turn', 0))
+
+    def copy(self):
+        # No need to copy the tuples, they are never mutated
+        state = State.__new__(State)
+        state.node_values = self.node_values
+        state.locations = self.locations
+        state.scores = self.scores
+        state.current_time = self.current_time
+        state.agent_turn = self.agent_turn
+        state.deadline = self.deadline
+        state.people = self.people
+        state.zobrist_hash = self.zobrist_hash
+        return state
 
     def expand(self):
-        succ_states = []
-        if not self.is_state_terminal():  # As long as we are not in a terminal state, we have successors
-            # This represents both the moving and termination successor, but if we do have the choice to terminate,
-            # we apply it after making sure we can make the choice
-            succ_states.append(State(self.node_values, self.locations, self.deadline, self.scores, self.current_time,
-                                     self.agent_turn + 1))
-            # If the agent is not terminated, and not on an edge, it is on a node and has a decision to make
-            if not (self.is_agent_terminated(self.agent_turn) or self.is_agent_moving(self.agent_turn)):
-                succ_states[-1].terminate_agent(self.agent_turn)  # The termination option
-                currnode = self.locations[self.agent_turn][1]
-                for i in self.graph[currnode]:  # For each neighbor of the current node
-                    succ_states.append(State(self.node_values, self.locations, self.deadline, self.scores,
-                                             self.current_time, self.agent_turn + 1))
-                    # By moving the agent with a specified weight, we mark its intention to go on that edge, the other.
-                    # This is of course only for the search tree where we consider all options. In reality we do not
-                    # know where the other agent wil go until it does the step
-                    succ_states[-1].move_agent(self.agent_turn, currnode, i, self.graph[currnode][i]['weight'])
-                # Move termination to end of successors
-                temp = succ_states[1:]
-                temp.append(succ_states[0])
-                succ_states = temp
-            # We update time and all relevant information to it when we finish a turn (2-plies)
-            if self.agent_turn == 1:
-                for state in succ_states:
-                    state.agent_turn = 0
-                    state.advance_time()
-                    state.update_moving_agents()
-                    # Do not update scores and people if the time unit of the next turn is after the deadline
-                    if state.current_time <= state.deadline:
-                        state.update_people_and_scores()
-        return succ_states
+        """
+        :return: The successors of the state, one per action of legal_actions() in the same order (the moves to the
+        neighbours and then termination), none in a terminal state
+        """
+        return [self.result(action) for action in self.legal_actions()]
+
+    def iter_successors(self):
+        """
+        The successors of expand() one at a time, each one is only created when it is asked for, so a search that cuts
+        off after the first few successors does not create the others
+        """
+        for action in self.legal_actions():
+            yield self.result(action)
+
+    def result(self, action):
+        """
+        :param action: One of legal_actions()
+        :return: The successor of the action, a new state
+        """
+        state = self.copy()
+        state.apply(action)
+        return state
+
+    def legal_actions(self):
+        """
+        :return: The actions of the agent in turn, in the order of the successors of State.expand(): the moves to the
+        neighbours and then TERMINATE, [WAIT] for an agent on an edge or terminated, and none in a terminal state. The
+        moves come from the graph (and are not copied), do not change them
+        """
+        if self.is_state_terminal():
+            return ()
+        if self.is_agent_terminated(self.agent_turn) or self.is_agent_moving(self.agent_turn):
+            return WAIT_ONLY
+        currnode = self.locations[self.agent_turn][1]
+        if self.prune_unreachable:
+            return tuple((currnode, i, weight) for i, weight in self.useful_edges(currnode)) + TERMINATE_ONLY
+        return self.graph.moves[currnode] + TERMINATE_ONLY
+
+    def make(self, action):
+        """
+        Plays one ply in place: the action of the agent in turn (one of legal_actions()), and the end of the round after
+        the last agent, as State.expand() does for the successor of the action
+        :return: The undo record of the ply, for unmake()
+        """
+        # The fields are tuples and numbers which are replaced and never mutated, so the old ones are all it takes to go
+        # back
+        undo = (self.node_values, self.locations, self.scores, self.current_time, self.agent_turn, self.people,
+                self.zobrist_hash)
+        self.apply(action)
+        return undo
+
+    def apply(self, action):
+        """
+        Plays one ply in place, like make() but with no way back
+        """
+        if action is not WAIT:
+            # A move marks the agent's intention to go on the edge, the search considers every option, while in the game
+            # the other agent does not know where it goes until it does the step
+            self.set_location(self.agent_turn, action)
+        self.advance_turn()
+        # We update time and all relevant information to it when the last agent of the round has acted
+        if self.agent_turn == 0:
+            self.end_round()
+            if self.macro_steps:
+                self.skip_rounds()
+
+    def unmake(self, undo):
+        """
+        Takes back the ply of make() which returned the undo record, plies are taken back in the reverse order of making
+        them
+        """
+        (self.node_values, self.locations, self.scores, self.current_time, self.agent_turn, self.people,
+         self.zobrist_hash) = undo
+
+    def end_round(self, rounds=1):
+        """
+        Called after the last agent of a round has acted: advances the time, moves the agents on edges one step on and
+        collects people
+        :param rounds: Number of rounds to play at once, only when no agent reaches a node before the last of them
+        """
+        self.advance_time(rounds)
+        self.update_moving_agents(rounds)
+        # Do not update scores and people if the time unit of the next turn is after the deadline
+        if self.current_time <= self.deadline:
+            self.update_people_and_scores()
+
+    def rounds_to_skip(self):
+        """
+        :return: The number of rounds until an agent reaches a node or the deadline is reached, if every agent is on an
+        edge or terminated at the start of a round (so all the agents can do is wait), otherwise 0
+        """
+        if self.agent_turn != 0 or not self.are_all_agents_moving_or_terminated() or self.is_state_terminal():
+            return 0
+        rounds = min(loc[2] for loc in self.locations if loc[2] > 0)
+        if self.deadline > 0:
+            rounds = min(rounds, math.ceil(self.deadline - self.current_time))
+        return rounds
+
+    def skip_rounds(self):
+        """
+        Plays the rounds of rounds_to_skip() in one step, the state ends up as after playing them one by one
+        :return: The number of rounds played
+        """
+        rounds = self.rounds_to_skip()
+        if rounds > 0:
+            self.end_round(rounds)
+        return rounds
+
+    def useful_edges(self, currnode):
+        """
+        :return: The (neighbour, weight) pairs of the edges of the node through which an agent starting now can reach
+        people before the deadline
+        """
+        distances = graph_util.get_distances_to_people(self.graph, self.node_values)
+        time_left = self.deadline - self.current_time if self.deadline > 0 else math.inf
+        return [(i, weight) for i, weight in self.graph.adjacency[currnode] if weight + distances[i] <= time_left]
 
     def advance_time(self, time_units=1):
+        self.zobrist_hash ^= self.zobrist.time_key(self.current_time)
         self.current_time += time_units
+        self.zobrist_hash ^= self.zobrist.time_key(self.current_time)
 
     def get_agent_location(self, aid):
         return self.locations[aid]
@@ -60,7 +226,7 @@ class State:
         return 0 < self.deadline <= self.current_time
 
     def people_remaining(self):
-        return sum(self.node_values)
+        return self.people
 
     def all_agents_terminated(self):
         return all(loc[0] == -1 for loc in self.locations)
@@ -68,13 +234,20 @@ class State:
     def is_agent_terminated(self, aid):
         return self.locations[aid][0] == -1
 
-    def update_moving_agents(self):
+    def update_moving_agents(self, time_units=1):
         for i in range(len(self.locations)):
             if self.locations[i][2] > 0:
-                self.locations[i][2] -= 1
+                orig, dest, steps = self.locations[i]
+                self.set_location(i, (orig, dest, steps - time_units))
 
     def terminate_agent(self, aid):
-        self.locations[aid] = [-1, -1, 0]
+        self.set_location(aid, (-1, -1, 0))
+
+    def set_location(self, aid, location):
+        location = tuple(location)
+        self.zobrist_hash ^= self.zobrist.location_key(aid, self.locations[aid])
+        self.zobrist_hash ^= self.zobrist.location_key(aid, location)
+        self.locations = self.locations[:aid] + (location,) + self.locations[aid + 1:]
 
     def are_all_agents_moving_or_terminated(self):
         return all(loc[2] > 0 or loc[1] == -1 for loc in self.locations)
@@ -89,45 +262,81 @@ class State:
         move on and take one step in it at the same turn.
         """
         if weight < 0:
-            graph_util.get_edge_weight(State.graph, orig, dest) - 1
-        self.locations[aid] = [orig, dest, weight]
+            weight = graph_util.get_edge_weight(State.graph, orig, dest)
+        self.set_location(aid, (orig, dest, weight))
 
     def update_people_and_scores(self):
         for i in range(len(self.locations)):
             if not self.is_agent_moving(i):
                 currnode = self.locations[i][1]
-                if currnode != -1:
-                    self.scores[i] += self.node_values[currnode]
-                    self.node_values[currnode] = 0
+                if currnode != -1 and self.node_values[currnode] > 0:
+                    value = self.node_values[currnode]
+                    self.zobrist_hash ^= self.zobrist.people_key(currnode, value)
+                    self.zobrist_hash ^= self.zobrist.score_key(i, self.scores[i])
+                    self.zobrist_hash ^= self.zobrist.score_key(i, self.scores[i] + value)
+                    self.scores = self.scores[:i] + (self.scores[i] + value,) + self.scores[i + 1:]
+                    self.node_values = self.node_values[:currnode] + (0,) + self.node_values[currnode + 1:]
+                    self.people -= value
 
     def is_state_terminal(self):
-        return self.deadline_reached() or self.people_remaining() <= 0 or self.all_agents_terminated()
+        return self.deadline_reached() or self.people <= 0 or self.all_agents_terminated()
 
     def print(self):
-        print(f'Current time-step: {self.current_time}')
-        print(f"There are {self.people_remaining()} people remaining")
-        self.print_graph()
-        self.print_agents_locations()
+        print(self.format())
+
+    def format(self, graph_text=None):
+        """
+        :param graph_text: The text of the graph (see graph_util.format_graph), formatted here if not given. It is the
+        same for every state of a game
+        :return: The text State.print() prints: the time, the people, the graph and the agents
+        """
+        if graph_text is None:
+            graph_text = graph_util.format_graph(self.graph)
+        lines = [f'Current time-step: {self.current_time}', f"There are {self.people_remaining()} people remaining"]
+        if graph_text:
+            lines.append(graph_text)
+        lines.append(self.format_agents_locations())
+        return '\n'.join(lines)
 
     def print_agents_locations(self):
+        print(self.format_agents_locations())
+
+    def format_agents_locations(self):
+        lines = []
         for i in range(len(self.locations)):
             if self.locations[i][1] != -1:
                 if self.locations[i][2] == 0:
-                    print(f"Agent {i} is at node {self.locations[i][1]}")
+                    lines.append(f"Agent {i} is at node {self.locations[i][1]}")
                 else:
-                    print(
-                        f"Agent {i} is at edge {self.locations[i][0]}-{self.locations[i][1]} with {self.locations[i][2]} steps left")
+                    lines.append(f"Agent {i} is at edge {self.locations[i][0]}-{self.locations[i][1]} with "
+                                 f"{self.locations[i][2]} steps left")
             else:
-                print(f"Agent {i} is terminated")
-        print(f'People saved vector: {self.scores}')
+                lines.append(f"Agent {i} is terminated")
+        lines.append(f'People saved vector: {list(self.scores)}')
+        return '\n'.join(lines)
 
     def print_graph(self):
         graph_util.print_graph(self.graph)
 
     def advance_turn(self):
+        self.zobrist_hash ^= self.zobrist.turn_key(self.agent_turn)
         self.agent_turn += 1
         if self.agent_turn == len(self.locations):
             self.agent_turn = 0
+        self.zobrist_hash ^= self.zobrist.turn_key(self.agent_turn)
+
+    def __eq__(self, other):
+        if not isinstance(other, State):
+            return NotImplemented
+        return (self.zobrist_hash == other.zobrist_hash and self.current_time == other.current_time and
+                self.agent_turn == other.agent_turn and self.locations == other.locations and
+                self.scores == other.scores and self.node_values == other.node_values and
+                self.deadline == other.deadline)
+
+    def __hash__(self):
+        # The state is mutable, so do not change a state while it is used as a key
+        return self.zobrist_hash
 
     def __str__(self):
-        return "Locations {}\nagent turn {}\nscores {}".format(self.locations, self.agent_turn, self.scores)
+        return "Locations {}\nagent turn {}\nscores {}".format(list(map(list, self.locations)), self.agent_turn,
+                                                              list(self.scores))
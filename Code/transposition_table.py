@@ -0,0 +1,76 @@
+import math
+
+EXACT = 0  # The stored value is the exact value of the position
+LOWER = 1  # The stored value is a lower bound (the search failed high)
+UPPER = 2  # The stored value is an upper bound (the search failed low)
+COMPLETE = math.inf  # Depth of an entry whose search reached the end of the game everywhere, it holds at any depth
+
+
+class TranspositionTable:
+    """
+    A fixed size table of search results keyed by the Zobrist hash of a state. Each slot holds one entry
+    (hash, depth, value, bound type, best move, generation). When two positions fall in the same slot the replacement
+    policy decides which one stays:
+        'depth' - keep the entry that was searched deeper (ties go to the new entry), unless it is from an older
+        generation
+        'always' - always keep the new entry
+    The table can be kept between decisions: every decision starts a new generation, so entries of earlier decisions
+    are still used but give way to the entries of the current one.
+    """
+
+    def __init__(self, size=2 ** 16, replacement='depth'):
+        if size <= 0:
+            raise ValueError('Transposition table size must be positive')
+        if replacement not in ['depth', 'always']:
+            raise ValueError('Replacement policy not recognized')
+        self.size = size
+        self.replacement = replacement
+        self.slots = [None] * size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def __getstate__(self):
+        # The table is sent to other processes empty
+        return self.size, self.replacement
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def new_generation(self):
+        """
+        Keeps the entries but counts probes and hits from zero
+        """
+        self.generation += 1
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, h):
+        """
+        :param h: Hash of the state
+        :return: The entry (hash, depth, value, bound type, best move, generation) or None if the state is not in the
+        table. The value can only be used if the entry's depth is enough, but the best move is a good first guess at any
+        depth
+        """
+        self.probes += 1
+        entry = self.slots[h % self.size]
+        if entry is not None and entry[0] == h:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, h, depth, value, bound, best_move=None):
+        """
+        :param depth: Remaining depth of the search that found the value, COMPLETE if no depth cutoff was reached in it
+        """
+        index = h % self.size
+        entry = self.slots[index]
+        if (entry is None or self.replacement == 'always' or entry[0] == h or depth >= entry[1] or
+                entry[5] < self.generation):
+            self.slots[index] = (h, depth, value, bound, best_move, self.generation)
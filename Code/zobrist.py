@@ -0,0 +1,40 @@
+import random
+
+
+class Zobrist:
+    """
+    Zobrist keys for hashing states incrementally. Every feature of a state (an agent location, a populated node, a
+    score, the time, the turn and the deadline) gets its own random 64 bit key and the hash of a state is the xor of the keys of its
+    features, so when a feature changes we only xor out the old key and xor in the new one.
+    Keys are created lazily and are derived from the feature itself, so the same feature gets the same key in every
+    process.
+    """
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.keys = {}
+
+    def key(self, *feature):
+        k = self.keys.get(feature)
+        if k is None:
+            k = random.Random(f'{self.seed}:{feature}').getrandbits(64)
+            self.keys[feature] = k
+        return k
+
+    def location_key(self, aid, location):
+        return self.key(0, aid, location[0], location[1], location[2])
+
+    def people_key(self, node, value):
+        return self.key(1, node, value)
+
+    def score_key(self, aid, score):
+        return self.key(2, aid, score)
+
+    def time_key(self, current_time):
+        return self.key(3, current_time)
+
+    def turn_key(self, agent_turn):
+        return self.key(4, agent_turn)
+
+    def deadline_key(self, deadline):
+        return self.key(5, float(deadline))  # Equal deadlines (10 and 10.0) get the same key